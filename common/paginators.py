@@ -0,0 +1,162 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import GeneratedField, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorPaginator(BasePagination):
+    """Keyset-пагинация: следующая страница выбирается по значениям полей сортировки последней записи,
+    без COUNT(*) и OFFSET. К сортировке модели всегда добавляется pk, чтобы позиция была однозначной."""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+        queryset = queryset.order_by(*(f'-{name}' if desc else name for name, desc in self.ordering))
+
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def get_ordering(self, queryset, view):
+        """Возвращает список (поле, по убыванию) для курсора: сортировка запроса или модели плюс pk."""
+        ordering = (queryset.query.order_by or getattr(view, 'cursor_ordering', None)
+                    or queryset.model._meta.ordering)
+        model_fields = {field.name: field.attname for field in queryset.model._meta.concrete_fields}
+        result = []
+        for item in ordering:
+            if not isinstance(item, str) or '__' in item or item.lstrip('-') == '?':
+                raise ValidationError('Эта сортировка не поддерживается в режиме курсора.')
+            desc = item.startswith('-')
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.attname
+            elif name not in queryset.query.annotations:
+                if name not in model_fields.values() and name not in model_fields:
+                    raise ValidationError('Эта сортировка не поддерживается в режиме курсора.')
+                name = model_fields.get(name, name)
+            if name not in [field for field, _ in result]:
+                result.append((name, desc))
+        pk_name = queryset.model._meta.pk.attname
+        if pk_name not in [field for field, _ in result]:
+            result.append((pk_name, False))
+        return result
+
+    def get_position_filter(self, position):
+        """Строит условие "строго после позиции" с учетом NULLS LAST / NULLS FIRST в PostgreSQL."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, position):
+            if value is None:
+                after = None if not desc else Q(**{f'{name}__isnull': False})
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__lt': value}) if desc else (
+                    Q(**{f'{name}__gt': value}) | Q(**{f'{name}__isnull': True}))
+                same = Q(**{name: value})
+            if after is not None:
+                condition |= equal & after
+            equal &= same
+        return condition
+
+    def decode_cursor(self, request, queryset):
+        """Разбирает курсор и приводит каждое значение позиции к типу своего поля сортировки.
+
+        Курсор приходит от клиента, поэтому любое несоответствие (не тот тип, не тот формат даты)
+        дает 404, а не ошибку в фильтре запроса."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [self.get_ordering_field(queryset, name).to_python(value) if value is not None else None
+                    for (name, _), value in zip(self.ordering, position)]
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_ordering_field(queryset, name):
+        """Поле модели или выходное поле аннотации, по которому идет сортировка name."""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        field = next(field for field in queryset.model._meta.concrete_fields if field.attname == name)
+        return field.output_field if isinstance(field, GeneratedField) else field
+
+    def encode_cursor(self, instance):
+        position = [getattr(instance, name) for name, _ in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(position, default=str).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+
+class Paginator(PageNumberPagination):
+    """Постраничная пагинация; при наличии параметра ?cursor= переключается на CursorPaginator."""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_paginator_class = CursorPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (self.cursor_paginator_class is not None
+                and self.cursor_paginator_class.cursor_query_param in request.query_params):
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class UnionPaginator(Paginator):
+    """Постраничная пагинация для запросов UNION: к ним нельзя добавить условие курсора, поэтому ?cursor= не действует."""
+    cursor_paginator_class = None
@@ -0,0 +1,65 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+
+def parse_sparse_fields(request):
+    """Разбирает ?fields= и ?omit= в пару (разрешенные поля или None, исключенные поля)."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+    fields = request.query_params.get(FIELDS_QUERY_PARAM)
+    only = {name.strip() for name in fields.split(',') if name.strip()} if fields else None
+    omit = {name.strip() for name in request.query_params.get(OMIT_QUERY_PARAM, '').split(',') if name.strip()}
+    return only, omit
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе сериализатора только поля из ?fields= и убирает поля из ?omit=."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        only, omit = parse_sparse_fields(self.context.get('request'))
+        if only is None and not omit:
+            return
+        for name in list(self.fields):
+            if (only is not None and name not in only) or name in omit:
+                self.fields.pop(name)
+
+    def get_only_fields(self, annotations=()):
+        """Возвращает поля модели для QuerySet.only() или None, если проекцию сузить нельзя.
+
+        Поля только для чтения, которые берутся из аннотаций queryset (annotations), вычисляются в SELECT
+        независимо от only() и пропускаются. Поля с произвольным источником (методы, свойства, вложенные пути)
+        могут обращаться к любым колонкам, поэтому для них выборка не сужается, чтобы не получить запрос
+        на каждую строку."""
+        opts = self.Meta.model._meta
+        names = []
+        for field in self.fields.values():
+            source = field.source
+            if source == 'pk' or (field.read_only and source in annotations):
+                continue
+            if source == '*' or '.' in source:
+                return None
+            try:
+                model_field = opts.get_field(source)
+            except FieldDoesNotExist:
+                return None
+            if model_field.concrete and not model_field.many_to_many:
+                names.append(source)
+        return names
+
+
+class SparseQuerysetMixin:
+    """Сужает SELECT вьюсета до полей, запрошенных через ?fields= / ?omit=."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        only, omit = parse_sparse_fields(self.request)
+        if only is None and not omit:
+            return queryset
+        only_fields = self.get_serializer().get_only_fields(queryset.query.annotations)
+        if only_fields is not None:
+            queryset = queryset.only(*only_fields)
+        return queryset
@@ -0,0 +1,131 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.redis import RedisCache
+from redis.commands.core import Script
+from rest_framework.throttling import BaseThrottle
+
+# Длительность периода лимита по первой букве: 10/s, 60/m, 1000/h, 10000/d
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# Пополняет ведро по времени сервера Redis и забирает из него токен одной атомарной операцией.
+# Возвращает 1/0 (пропустить ли запрос) и остаток токенов строкой, чтобы Redis не отбросил дробную часть.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+# Скрипт регистрируется один раз; sha вычисляется заранее, на сервер он загружается при первом EVALSHA
+TOKEN_BUCKET = Script(None, TOKEN_BUCKET_SCRIPT.encode())
+
+
+def parse_rate(rate):
+    """Разбирает лимит вида "число/период" в емкость ведра и скорость пополнения в токенах в секунду."""
+    number, period = rate.split('/')
+    capacity = int(number)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def take_token(key, capacity, rate):
+    """Забирает токен из ведра key и возвращает (пропущен ли запрос, остаток токенов).
+
+    С Redis ведро хранится в хэше и обновляется Lua-скриптом: одно обращение к серверу на проверку,
+    без гонок между воркерами. С другими бэкендами кэша (тесты, локальная разработка) используется
+    тот же алгоритм поверх get/set без атомарности."""
+    # django.core.cache.cache - прокси, поэтому тип бэкенда проверяется у самого объекта кэша
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(cache, RedisCache):
+        key = cache.make_and_validate_key(key)
+        client = cache._cache.get_client(key, write=True)
+        allowed, tokens = TOKEN_BUCKET(keys=[key], args=[capacity, rate], client=client)
+        return bool(allowed), float(tokens)
+    now = time.time()
+    tokens, ts = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    cache.set(key, (tokens, now), timeout=math.ceil(capacity / rate) + 1)
+    return allowed, tokens
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ограничение частоты запросов по алгоритму token bucket с ведрами в Redis.
+
+    Лимиты задаются в settings.THROTTLE_RATES по ключу "throttle_scope.action" вьюсета (или просто
+    throttle_scope для обычных представлений) отдельно для каждого вида ограничения: {"user": "30/m"}.
+    Представления без настроенного лимита не ограничиваются и не обращаются к Redis.
+    Остаток лимита сохраняется в request.rate_limit для заголовков ответа, см. RateLimitHeadersMixin."""
+    kind = None
+
+    def get_rate(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            return None
+        action = getattr(view, 'action', None)
+        rates = settings.THROTTLE_RATES.get(f'{scope}.{action}' if action else scope, {})
+        return rates.get(self.kind)
+
+    def allow_request(self, request, view):
+        rate = self.get_rate(view)
+        if rate is None:
+            return True
+        ident = self.get_ident(request)
+        if ident is None:
+            return True
+        capacity, self.rate = parse_rate(rate)
+        key = f'throttle:{view.throttle_scope}:{getattr(view, "action", None) or ""}:{self.kind}:{ident}'
+        allowed, self.tokens = take_token(key, capacity, self.rate)
+        limit = (capacity, math.floor(self.tokens))
+        current = getattr(request, 'rate_limit', None)
+        # Из нескольких ограничений в заголовках показывается то, в котором осталось меньше запросов
+        if current is None or limit[1] < current[1]:
+            request.rate_limit = limit
+        return allowed
+
+    def wait(self):
+        """Через сколько секунд в ведре появится токен."""
+        return (1 - self.tokens) / self.rate
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    """Лимит на аутентифицированного пользователя."""
+    kind = 'user'
+
+    def get_ident(self, request):
+        return request.user.pk if request.user and request.user.is_authenticated else None
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    """Лимит на IP-адрес клиента: REMOTE_ADDR или адрес из X-Forwarded-For, добавленный одним из NUM_PROXIES
+    доверенных прокси. Без NUM_PROXIES DRF брал бы весь присланный клиентом заголовок, и его подмена давала бы
+    новое ведро на каждый запрос."""
+    kind = 'ip'
+
+
+class RateLimitHeadersMixin:
+    """Добавляет в ответ заголовки X-RateLimit-Limit и X-RateLimit-Remaining, если запрос проходил через лимит.
+
+    Retry-After в ответе 429 выставляет сам DRF по TokenBucketThrottle.wait()."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            response['X-RateLimit-Limit'], response['X-RateLimit-Remaining'] = map(str, rate_limit)
+        return response
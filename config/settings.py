@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'phonenumber_field',
@@ -111,20 +112,45 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = "users.User"
 
+# Аутентификация без загрузки пользователя из БД на чтение: пользователь собирается из claims токена
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', False) == 'True'
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.TokenUserAuthentication" if JWT_STATELESS_AUTH
+        else "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+    "DEFAULT_THROTTLE_CLASSES": (
+        "common.throttling.UserRateThrottle",
+        "common.throttling.IPRateThrottle",
+    ),
+    # Число доверенных прокси перед приложением: по нему лимит на IP берет адрес клиента из X-Forwarded-For.
+    # При 0 используется REMOTE_ADDR, а присланный клиентом X-Forwarded-For игнорируется
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
+}
+
+# Лимиты частоты запросов (token bucket в Redis) по ключу "throttle_scope.action" вьюсета или throttle_scope
+# представления: для каждого пользователя ("user") и каждого IP-адреса ("ip")
+THROTTLE_RATES = {
+    "rent.create": {"user": "30/m", "ip": "120/m"},
+    "rent.bulk_checkout": {"user": "10/m", "ip": "60/m"},
+    "login": {"ip": "10/m"},
+    "users.create": {"ip": "20/h"},
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.RoleTokenRefreshSerializer",
 }
 
 PHONE_NUMBER_FIELD_DEFAULT_REGION = "RU"
 
+# Конфигурация полнотекстового поиска PostgreSQL для каталога книг
+SEARCH_CONFIG = 'russian'
+
 # URL-адрес брокера сообщений
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 # URL-адрес брокера результатов, также Redis
@@ -142,8 +168,37 @@ CELERY_BEAT_SCHEDULE = {
         "task": "library.tasks.checking_deadline",
         "schedule": timedelta(minutes=30),
     },
+    "due_soon_digests": {
+        "task": "library.tasks.send_due_soon_digests",
+        "schedule": timedelta(hours=1),
+    },
+    "rental_archiving": {
+        "task": "library.tasks.archive_rentals",
+        "schedule": timedelta(days=1),
+    },
 }
 
+# Кэш ответов каталога хранится в том же Redis, что использует Celery
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", CELERY_BROKER_URL)
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "KEY_PREFIX": "library",
+        },
+    }
+# Время жизни закэшированных ответов каталога, в секундах
+CATALOG_CACHE_TIMEOUT = 15 * 60
+# Время жизни закэшированных фасетов каталога, в секундах
+FACETS_CACHE_TIMEOUT = 60
+# Время жизни закэшированных групп пользователя, в секундах; кэш также сбрасывается при изменении групп
+ROLES_CACHE_TIMEOUT = 60 * 60
+# Закрытые выдачи старше этого срока переносятся в архивную таблицу
+RENTAL_ARCHIVE_AFTER = timedelta(days=int(os.getenv("RENTAL_ARCHIVE_AFTER_DAYS", 365)))
+# Сколько выдач переносится в архив одной транзакцией
+RENTAL_ARCHIVE_BATCH_SIZE = 5000
+
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND')
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
@@ -153,4 +208,17 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
-EMAIL_ADMIN = EMAIL_HOST_USER
\ No newline at end of file
+EMAIL_ADMIN = EMAIL_HOST_USER
+
+# Сколько писем отправляется через одно соединение с почтовым сервером
+NOTIFICATION_BATCH_SIZE = 100
+# Сколько читателей обрабатывает одна задача рассылки напоминаний
+NOTIFICATION_READERS_PER_TASK = 500
+# Сколько задач рассылки может запустить один воркер, чтобы не перегружать почтовый сервер
+NOTIFICATION_TASK_RATE_LIMIT = os.getenv("NOTIFICATION_TASK_RATE_LIMIT", "30/m")
+# Как часто повторять напоминание о просроченной выдаче; 0 - напомнить один раз
+OVERDUE_REMINDER_INTERVAL = timedelta(days=int(os.getenv("OVERDUE_REMINDER_INTERVAL_DAYS", 1)))
+# За сколько дней до срока возврата читателю приходит сводка книг, которые пора вернуть
+DUE_SOON_REMINDER_DAYS = int(os.getenv("DUE_SOON_REMINDER_DAYS", 3))
+# Часы местного времени [с, до), в которые отправляются сводки о скором сроке возврата
+DUE_SOON_SEND_WINDOW = (9, 21)
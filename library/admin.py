@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from library.models import Book, Author, Genre, Rental
+from library.models import ArchivedRental, Book, BookCopy, Author, Genre, Hold, Rental
 from users.models import User
 
 
@@ -17,6 +17,41 @@ class UserAdmin(admin.ModelAdmin):
     )
 
 
+class YearOfPublicationFilter(admin.SimpleListFilter):
+    """Фильтр книг по диапазонам года издания вместо списка всех встречающихся годов."""
+    title = 'год издания'
+    parameter_name = 'year_bucket'
+    buckets = {
+        'before_1900': ('до 1900', None, 1899),
+        '1900_1949': ('1900–1949', 1900, 1949),
+        '1950_1999': ('1950–1999', 1950, 1999),
+        '2000_2009': ('2000–2009', 2000, 2009),
+        '2010_2019': ('2010–2019', 2010, 2019),
+        'since_2020': ('с 2020', 2020, None),
+        'unknown': ('не указан', None, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, _, _) in self.buckets.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.buckets:
+            return queryset
+        if self.value() == 'unknown':
+            return queryset.filter(year_of_publication__isnull=True)
+        _, year_min, year_max = self.buckets[self.value()]
+        if year_min is not None:
+            queryset = queryset.filter(year_of_publication__gte=year_min)
+        if year_max is not None:
+            queryset = queryset.filter(year_of_publication__lte=year_max)
+        return queryset
+
+
+class BookCopyInline(admin.TabularInline):
+    model = BookCopy
+    extra = 0
+
+
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     """Класс для настройки отображения модели "Book" в административной панели"""
@@ -26,16 +61,29 @@ class BookAdmin(admin.ModelAdmin):
         'title',
         'year_of_publication',
         'genre',
+        'available_copies',
+        'total_copies',
     )
+    # Счетчики существующей книги меняются только атомарно при выдаче, возврате и через API
+    readonly_fields = ('total_copies', 'available_copies',)
+    inlines = (BookCopyInline,)
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.readonly_fields if obj else ('available_copies',)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.available_copies = obj.total_copies
+        super().save_model(request, obj, form, change)
     list_filter = (
-        'year_of_publication',
+        YearOfPublicationFilter,
         'genre',
     )
 
     search_fields =(
         'title',
         'authors',
-        'year_of_publication',
+        '=year_of_publication',
         'genre',
     )
 
@@ -68,3 +116,40 @@ class RentalAdmin(admin.ModelAdmin):
         'is_returned',
         'deadline',
     )
+
+    def save_model(self, request, obj, form, change):
+        if change and 'deadline' in form.changed_data:
+            obj.next_reminder_at = obj.deadline
+            obj.due_soon_notified_at = None
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(ArchivedRental)
+class ArchivedRentalAdmin(admin.ModelAdmin):
+    """Класс для настройки отображения модели "ArchivedRental" в административной панели"""
+    list_display = (
+        'pk',
+        'reader',
+        'book',
+        'rental_date',
+        'return_date',
+        'archived_at',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    """Класс для настройки отображения модели "Hold" в административной панели"""
+    list_display = (
+        'pk',
+        'reader',
+        'book',
+        'created_at',
+        'fulfilled_at',
+    )
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.utils.timezone import now
+
+from library.models import ArchivedRental, Hold, Rental
+
+# Колонки, которые переносятся из рабочей таблицы выдач в архивную без изменений
+ARCHIVED_COLUMNS = ('id', 'reader_id', 'book_id', 'copy_id', 'rental_date', 'return_date', 'deadline')
+HISTORY_FIELDS = ('pk', 'reader', 'book', 'copy', 'rental_date', 'return_date', 'deadline', 'returned', 'archived')
+
+
+def archive_batch(before, batch_size):
+    """Переносит в архив одну пачку закрытых выдач, возвращенных раньше before, одним запросом.
+
+    Строки, заблокированные параллельными транзакциями, пропускаются и попадут в следующий запуск.
+    Брони, исполненные этими выдачами, отвязываются в том же запросе."""
+    columns = ', '.join(ARCHIVED_COLUMNS)
+    sql = f"""
+        WITH batch AS (
+            SELECT id FROM {Rental._meta.db_table}
+            WHERE is_returned AND return_date < %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ),
+        detached AS (
+            UPDATE {Hold._meta.db_table} SET rental_id = NULL WHERE rental_id IN (SELECT id FROM batch)
+        ),
+        moved AS (
+            DELETE FROM {Rental._meta.db_table} WHERE id IN (SELECT id FROM batch)
+            RETURNING {columns}
+        )
+        INSERT INTO {ArchivedRental._meta.db_table} ({columns}, archived_at)
+        SELECT {columns}, %s FROM moved
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [before, batch_size, now()])
+        return cursor.rowcount
+
+
+def archive_closed_rentals(older_than=None, batch_size=None):
+    """Переносит в архив закрытые выдачи старше older_than пачками по batch_size, каждая в своей транзакции."""
+    before = now() - (older_than or settings.RENTAL_ARCHIVE_AFTER)
+    batch_size = batch_size or settings.RENTAL_ARCHIVE_BATCH_SIZE
+    archived = 0
+    while True:
+        moved = archive_batch(before, batch_size)
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+def rental_history(reader=None):
+    """История выдач из рабочей и архивной таблиц одним запросом UNION ALL, новые выдачи первыми."""
+    current = Rental.objects.annotate(returned=F('is_returned'), archived=Value(False))
+    archived = ArchivedRental.objects.annotate(returned=Value(True), archived=Value(True))
+    if reader is not None:
+        current = current.filter(reader=reader)
+        archived = archived.filter(reader=reader)
+    return current.order_by().values(*HISTORY_FIELDS).union(
+        archived.order_by().values(*HISTORY_FIELDS), all=True,
+    ).order_by('-rental_date', '-pk')
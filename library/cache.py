@@ -0,0 +1,111 @@
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+# Пространства имен кэша каталога. Ключ ответа включает текущие версии своих пространств,
+# поэтому инвалидация сводится к увеличению версии, без поиска и удаления ключей.
+BOOK_LIST = 'books:list'
+BOOK_AVAILABILITY = 'books:availability'
+AUTHORS = 'authors'
+GENRES = 'genres'
+
+
+def book_detail(pk):
+    """Пространство имен кэша карточки конкретной книги."""
+    return f'books:detail:{pk}'
+
+
+def _version_key(namespace):
+    return f'catalog:version:{namespace}'
+
+
+def _modified_key(namespace):
+    return f'catalog:modified:{namespace}'
+
+
+def get_markers(namespaces):
+    """Возвращает версии пространств имен и время последнего изменения среди них одним обращением к кэшу.
+
+    Отсутствующие версии заводятся от текущего времени, а не от нуля: после вытеснения ключа
+    номер версии не повторит старый, и клиентский ETag не совпадет по ошибке."""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    keys += [_modified_key(namespace) for namespace in namespaces]
+    values = cache.get_many(keys)
+    missing = [namespace for namespace in namespaces if _version_key(namespace) not in values]
+    if missing:
+        now = time.time()
+        for namespace in missing:
+            cache.add(_version_key(namespace), int(now * 1000), timeout=None)
+            cache.add(_modified_key(namespace), int(now), timeout=None)
+        values = cache.get_many(keys)
+    versions = [values.get(_version_key(namespace), 0) for namespace in namespaces]
+    modified = max(values.get(_modified_key(namespace), 0) for namespace in namespaces)
+    return versions, modified
+
+
+def bump(*namespaces):
+    """Увеличивает версии пространств имен, делая устаревшими все ключи и ETag, построенные на них.
+
+    Внутри транзакции версии увеличиваются только после COMMIT: иначе запрос, пришедший между увеличением
+    версии и коммитом, прочитал бы старые строки и закэшировал их под новой версией. Вне транзакции
+    версии увеличиваются сразу."""
+    transaction.on_commit(partial(_bump, namespaces))
+
+
+def _bump(namespaces):
+    now = time.time()
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        cache.add(key, int(now * 1000), timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Ключ мог быть вытеснен между add и incr
+            cache.set(key, int(now * 1000), timeout=None)
+        cache.set(_modified_key(namespace), int(now), timeout=None)
+
+
+def invalidate_books(pks, availability_only=False):
+    """Инвалидирует кэш карточек книг и списков, в которые они могут входить.
+
+    При изменении только доступности списки без фильтра по is_available остаются в кэше."""
+    bump(*(book_detail(pk) for pk in pks))
+    bump(BOOK_AVAILABILITY if availability_only else BOOK_LIST)
+
+
+def cached_response(request, namespaces, get_response, timeout=None):
+    """Отвечает 304 по If-None-Match/If-Modified-Since, иначе берет данные из кэша
+    или вызывает get_response и сохраняет успешный результат.
+
+    Ключ и ETag строятся из нормализованной строки запроса и версий пространств имен."""
+    versions, modified = get_markers(namespaces)
+    params = sorted((name, sorted(values)) for name, values in request.query_params.lists())
+    raw = repr((request.get_host(), request.path, request.META.get('HTTP_ACCEPT'), params, versions))
+    digest = hashlib.sha256(raw.encode()).hexdigest()
+    etag = quote_etag(digest[:32])
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=modified or None)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    key = f'catalog:response:{digest}'
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data)
+    else:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+        cache.set(key, response.data, timeout=timeout or settings.CATALOG_CACHE_TIMEOUT)
+    response['ETag'] = etag
+    if modified:
+        response['Last-Modified'] = http_date(modified)
+    return response
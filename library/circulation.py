@@ -0,0 +1,112 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When, Window
+from django.db.models.functions import Least, RowNumber
+from django.utils.timezone import now
+from rest_framework.exceptions import ValidationError
+
+from library import cache
+from library.models import Book, Hold, Rental
+
+# Срок, на который выдается книга
+RENTAL_PERIOD = timedelta(days=30)
+# Сколько позиций можно передать в одну массовую операцию
+BULK_MAX_ITEMS = 100
+
+CHECKED_OUT = 'checked_out'
+UNAVAILABLE = 'unavailable'
+RETURNED = 'returned'
+ALREADY_RETURNED = 'already_returned'
+
+
+def checkout_books(reader, book_ids):
+    """Выдает читателю пачку книг за фиксированное число запросов и возвращает результат по каждой книге.
+
+    Книги со свободными экземплярами блокируются SELECT ... FOR UPDATE в порядке pk, поэтому параллельные
+    пачки не выдают больше экземпляров, чем есть, и не встают во взаимную блокировку."""
+    with transaction.atomic():
+        claimed = list(Book.objects.select_for_update().filter(pk__in=book_ids, available_copies__gt=0)
+                       .order_by('pk').values_list('pk', flat=True))
+        Book.objects.filter(pk__in=claimed).update(available_copies=F('available_copies') - 1)
+        deadline = now() + RENTAL_PERIOD
+        rentals = Rental.objects.bulk_create(
+            [Rental(reader=reader, book_id=pk, deadline=deadline, next_reminder_at=deadline) for pk in claimed])
+    rental_ids = {rental.book_id: rental.pk for rental in rentals}
+    if claimed:
+        # update() и bulk_create не отправляют сигналы, поэтому кэш доступности сбрасываем явно
+        cache.invalidate_books(claimed, availability_only=True)
+    return [
+        {'book': pk, 'status': CHECKED_OUT, 'rental': rental_ids[pk]} if pk in rental_ids
+        else {'book': pk, 'status': UNAVAILABLE}
+        for pk in book_ids
+    ]
+
+
+def release_books(book_ids):
+    """Передает возвращенные экземпляры следующим в очереди броней, остальные возвращает в фонд.
+
+    book_ids содержит pk книги по разу на каждый возвращенный экземпляр. Вызывается внутри транзакции
+    возврата. Строки книг блокируются так же, как при оформлении брони, поэтому бронь не может встать
+    в очередь на книгу, экземпляр которой в этот момент уходит в фонд.
+    Возвращает pk книг, у которых изменился счетчик свободных экземпляров, чтобы вызывающий сбросил их кэш."""
+    copies = Counter(book_ids)
+    if not copies:
+        return []
+    list(Book.objects.select_for_update().filter(pk__in=copies).order_by('pk').values_list('pk', flat=True))
+    # Первые в очереди на каждую книгу, не больше числа ее возвращенных экземпляров
+    holds = Hold.objects.active().filter(book_id__in=copies).annotate(
+        queue_position=Window(RowNumber(), partition_by=F('book_id'), order_by=F('pk').asc()),
+    ).filter(queue_position__lte=max(copies.values())).order_by('book_id', 'pk')
+    holds = [hold for hold in holds if hold.queue_position <= copies[hold.book_id]]
+    deadline = now() + RENTAL_PERIOD
+    rentals = Rental.objects.bulk_create(
+        [Rental(reader_id=hold.reader_id, book_id=hold.book_id, deadline=deadline, next_reminder_at=deadline)
+         for hold in holds])
+    fulfilled_at = now()
+    for hold, rental in zip(holds, rentals):
+        hold.fulfilled_at = fulfilled_at
+        hold.rental = rental
+        copies[hold.book_id] -= 1
+    Hold.objects.bulk_update(holds, ['fulfilled_at', 'rental'])
+    released = {pk: count for pk, count in copies.items() if count}
+    if released:
+        # Выдачи, оформленные до учета экземпляров или в админке, не уменьшали счетчик, поэтому он ограничен фондом
+        Book.objects.filter(pk__in=released).update(available_copies=Least(F('available_copies') + Case(
+            *(When(pk=pk, then=Value(count)) for pk, count in released.items()),
+            output_field=PositiveIntegerField(),
+        ), F('total_copies')))
+    return list(released)
+
+
+def change_copies(book, delta):
+    """Добавляет экземпляры в фонд или списывает свободные; новые экземпляры сначала получают брони."""
+    with transaction.atomic():
+        if delta < 0:
+            # Списать можно только свободные экземпляры; условие и изменение выполняются одним UPDATE
+            changed = Book.objects.filter(pk=book.pk, available_copies__gte=-delta).update(
+                total_copies=F('total_copies') + delta, available_copies=F('available_copies') + delta)
+            if not changed:
+                raise ValidationError('Нельзя списать экземпляры, которые выданы читателям.')
+        elif delta > 0:
+            Book.objects.filter(pk=book.pk).update(total_copies=F('total_copies') + delta)
+            release_books([book.pk] * delta)
+    book.refresh_from_db(fields=['total_copies', 'available_copies', 'is_available'])
+    cache.invalidate_books([book.pk])
+
+
+def return_rentals(rental_ids):
+    """Закрывает пачку аренд, передает книги по броням или в фонд и отдает результат по каждой аренде."""
+    with transaction.atomic():
+        open_rentals = dict(Rental.objects.select_for_update().filter(pk__in=rental_ids, is_returned=False)
+                            .order_by('pk').values_list('pk', 'book_id'))
+        Rental.objects.filter(pk__in=open_rentals).update(is_returned=True, return_date=now())
+        released = release_books(list(open_rentals.values()))
+    if released:
+        cache.invalidate_books(released, availability_only=True)
+    return [
+        {'rental': pk, 'status': RETURNED, 'book': open_rentals[pk]} if pk in open_rentals
+        else {'rental': pk, 'status': ALREADY_RETURNED}
+        for pk in rental_ids
+    ]
@@ -0,0 +1,120 @@
+import csv
+import json
+import zlib
+
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import OuterRef
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from library.models import Author, Book, Rental
+
+# Сколько строк забирать с сервера БД за один FETCH серверного курсора
+EXPORT_CHUNK_SIZE = 2000
+# Размер куска ответа: мелкие строки склеиваются, чтобы не отдавать их по одной
+STREAM_BUFFER_SIZE = 64 * 1024
+EXPORT_FIELDS = {
+    'books': ('id', 'title', 'description', 'year_of_publication', 'genre_id', 'total_copies', 'available_copies',
+              'is_available', 'updated_at', 'author_ids'),
+    'authors': ('id', 'name', 'country', 'biography', 'updated_at'),
+    'rentals': ('id', 'reader_id', 'book_id', 'copy_id', 'rental_date', 'return_date', 'is_returned', 'deadline'),
+}
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class StreamRenderer(BaseRenderer):
+    """Пропускает любой Accept, чтобы экспорт отдавался независимо от согласования формата DRF.
+
+    Сама выгрузка идет StreamingHttpResponse мимо рендерера, поэтому через render проходят только ответы
+    DRF с ошибками (403, 400), и они отдаются в JSON, как и в остальном API."""
+    media_type = '*/*'
+    format = 'stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data, JSONRenderer.media_type, renderer_context)
+
+
+def get_export_queryset(name):
+    """Возвращает queryset для выгрузки; авторы книги собираются в массив подзапросом, без GROUP BY."""
+    if name == 'books':
+        through = Book.authors.through
+        author_ids = through.objects.filter(book_id=OuterRef('pk')).order_by('author_id').values('author_id')
+        return Book.objects.annotate(author_ids=ArraySubquery(author_ids))
+    return {'authors': Author, 'rentals': Rental}[name].objects.all()
+
+
+def export_rows(name):
+    """Лениво читает строки таблицы серверным курсором, не материализуя queryset."""
+    return get_export_queryset(name).order_by('pk').values(*EXPORT_FIELDS[name]).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _serialize(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=_serialize) + '\n'
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку вместо накопления."""
+
+    def write(self, value):
+        return value
+
+
+def _csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        values = []
+        for field in fields:
+            value = row[field]
+            if isinstance(value, list):
+                value = ';'.join(str(item) for item in value)
+            elif value is not None and not isinstance(value, (str, bool, int)):
+                value = _serialize(value)
+            values.append(value)
+        yield writer.writerow(values)
+
+
+def _buffered(chunks):
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= STREAM_BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, file_format, compress=False):
+    """Возвращает генератор байтовых кусков выгрузки в NDJSON или CSV, при необходимости сжатых gzip."""
+    rows = export_rows(name)
+    if file_format == 'csv':
+        chunks = _csv(rows, EXPORT_FIELDS[name])
+    else:
+        chunks = _ndjson(rows)
+    chunks = _buffered(chunks)
+    return _gzip(chunks) if compress else chunks
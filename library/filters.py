@@ -0,0 +1,51 @@
+from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend
+
+from library.models import Book, Rental, RentalStatus
+from library.search import search_books
+
+
+class BookFilter(filters.FilterSet):
+    """Фильтры каталога книг, включая диапазон годов издания."""
+    year_min = filters.NumberFilter(field_name='year_of_publication', lookup_expr='gte')
+    year_max = filters.NumberFilter(field_name='year_of_publication', lookup_expr='lte')
+    # Вычисляемая колонка из счетчика свободных экземпляров; django-filter не выводит для нее фильтр сам
+    is_available = filters.BooleanFilter()
+
+    class Meta:
+        model = Book
+        fields = ('title', 'genre', 'is_available',)
+
+
+class RentalFilter(filters.FilterSet):
+    """Фильтр выдач по статусу; условие строится по колонкам, а не по аннотации, чтобы работал индекс."""
+    status = filters.ChoiceFilter(choices=RentalStatus.choices, method='filter_status')
+
+    class Meta:
+        model = Rental
+        fields = ('status',)
+
+    def filter_status(self, queryset, name, value):
+        return queryset.filter_status(value)
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск книг по параметру ?q= с сортировкой по релевантности."""
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_books(queryset, text)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Полнотекстовый поиск по названию, авторам, жанру и описанию',
+                'schema': {'type': 'string'},
+            },
+        ]
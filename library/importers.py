@@ -0,0 +1,171 @@
+import csv
+import json
+import re
+
+from django.db import transaction
+
+from library import cache
+from library.models import Author, Book, Genre
+from library.search import update_search_vector
+
+DEFAULT_BATCH_SIZE = 1000
+# Разделитель авторов в CSV-колонке authors
+AUTHORS_SEPARATOR = ';'
+# Год издания: первое отдельное число до 4 цифр, как в миграции 0009
+YEAR_PATTERN = re.compile(r'\b(\d{1,4})\b')
+# Сколько ошибок разбора строк сохранять в отчете об импорте
+MAX_REPORTED_ERRORS = 20
+FORMATS = {
+    'csv': 'csv',
+    'ndjson': 'ndjson',
+    'jsonl': 'ndjson',
+}
+
+
+def detect_format(file_name):
+    """Определяет формат файла каталога по расширению."""
+    extension = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+    return FORMATS.get(extension)
+
+
+def read_records(lines, file_format):
+    """Лениво читает записи из итератора строк: словари для CSV, сырые строки для NDJSON."""
+    if file_format == 'csv':
+        yield from csv.DictReader(lines)
+    elif file_format == 'ndjson':
+        for line in lines:
+            if line.strip():
+                yield line
+    else:
+        raise ValueError(f'Неизвестный формат файла: {file_format}')
+
+
+class CatalogImporter:
+    """Потоковый импорт книг пачками: жанры и авторы через upsert, книги и связи с авторами через bulk_create."""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.rows = 0
+        self.books = 0
+        self.skipped = 0
+        self.errors = []
+
+    def run(self, lines, file_format):
+        """Импортирует записи из итератора строк и возвращает отчет."""
+        batch = []
+        for self.rows, record in enumerate(read_records(lines, file_format), start=1):
+            try:
+                batch.append(self.clean(record))
+            except (ValueError, TypeError, AttributeError) as error:
+                self.skip(error)
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        if batch:
+            self.save_batch(batch)
+        return self.report()
+
+    def clean(self, record):
+        """Приводит запись к полям книги; бросает ValueError для невалидной записи."""
+        if isinstance(record, str):
+            record = json.loads(record)
+        if not isinstance(record, dict):
+            raise ValueError('Запись должна быть объектом.')
+        title = (record.get('title') or '').strip()
+        if not title:
+            raise ValueError('Не указано название книги.')
+
+        authors = record.get('authors') or []
+        if isinstance(authors, str):
+            authors = authors.split(AUTHORS_SEPARATOR)
+        authors = list(dict.fromkeys(name.strip() for name in authors if name and name.strip()))
+
+        year = YEAR_PATTERN.search(str(record.get('year_of_publication') or ''))
+
+        is_available = record.get('is_available', True)
+        if isinstance(is_available, str):
+            is_available = is_available.strip().lower() not in ('0', 'false', 'no', 'нет', '')
+
+        # Значение по умолчанию только для отсутствующей колонки: явный 0 означает книгу без экземпляров
+        copies = int(raw) if (raw := record.get('copies')) not in (None, '') else 1
+        if copies < 0:
+            raise ValueError('Число экземпляров не может быть отрицательным.')
+
+        row = {
+            'title': title,
+            'description': record.get('description') or None,
+            'year_of_publication': int(year.group(1)) if year else None,
+            'genre': (record.get('genre') or '').strip() or None,
+            'authors': authors,
+            'total_copies': copies,
+            # Старый формат без счетчика: флаг is_available=false значит, что все экземпляры выданы
+            'available_copies': copies if is_available else 0,
+        }
+        self.check_length(Book, 'title', row['title'])
+        self.check_length(Genre, 'title', row['genre'])
+        for name in authors:
+            self.check_length(Author, 'name', name)
+        return row
+
+    @staticmethod
+    def check_length(model, field_name, value):
+        """Отсекает значения длиннее поля модели, чтобы одна запись не роняла всю пачку."""
+        max_length = model._meta.get_field(field_name).max_length
+        if value and len(value) > max_length:
+            raise ValueError(f'{model._meta.verbose_name}: значение длиннее {max_length} символов.')
+
+    def skip(self, error):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': self.rows, 'error': str(error)})
+
+    @transaction.atomic
+    def save_batch(self, rows):
+        """Сохраняет пачку записей за фиксированное число запросов, независимо от ее размера."""
+        genre_titles = {row['genre'] for row in rows if row['genre']}
+        genres = Genre.objects.bulk_create(
+            [Genre(title=title) for title in genre_titles],
+            update_conflicts=True, unique_fields=['title'], update_fields=['title'],
+        )
+        genre_ids = {genre.title: genre.pk for genre in genres}
+
+        author_names = {name for row in rows for name in row['authors']}
+        authors = Author.objects.bulk_create(
+            [Author(name=name) for name in author_names],
+            update_conflicts=True, unique_fields=['name'], update_fields=['name'],
+        )
+        author_ids = {author.name: author.pk for author in authors}
+
+        books = Book.objects.bulk_create([
+            Book(
+                title=row['title'],
+                description=row['description'],
+                year_of_publication=row['year_of_publication'],
+                genre_id=genre_ids.get(row['genre']),
+                total_copies=row['total_copies'],
+                available_copies=row['available_copies'],
+            )
+            for row in rows
+        ])
+        through = Book.authors.through
+        through.objects.bulk_create(
+            [through(book_id=book.pk, author_id=author_ids[name]) for book, row in zip(books, rows)
+             for name in row['authors']],
+            ignore_conflicts=True,
+        )
+        update_search_vector(Book.objects.filter(pk__in=[book.pk for book in books]))
+        # bulk_create не отправляет сигналы, поэтому кэш каталога сбрасываем явно
+        cache.bump(cache.BOOK_LIST, cache.AUTHORS, cache.GENRES)
+
+        self.books += len(books)
+        if self.progress:
+            self.progress(self)
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'books': self.books,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management import BaseCommand
+
+from library.exporters import CONTENT_TYPES, EXPORT_FIELDS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка книг, авторов или выдач в NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORT_FIELDS), help='выгружаемая таблица')
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='ndjson', help='формат выгрузки')
+        parser.add_argument('--gzip', action='store_true', help='сжимать выгрузку gzip')
+        parser.add_argument('--output', default='-', help='путь к файлу или "-" для вывода в stdout')
+
+    def handle(self, *args, **options):
+        chunks = stream_export(options['name'], options['format'], compress=options['gzip'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(options['output'], 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Выгрузка сохранена в {options['output']}"))
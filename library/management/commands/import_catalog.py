@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from library.importers import DEFAULT_BATCH_SIZE, CatalogImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт каталога книг из CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='путь к файлу каталога или "-" для чтения из stdin')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='формат файла (по умолчанию по расширению)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='размер пачки записей')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if file_format is None:
+            raise CommandError('Не удалось определить формат файла, укажите --format.')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным.')
+
+        importer = CatalogImporter(batch_size=options['batch_size'], progress=self.report_progress)
+        if path == '-':
+            report = importer.run(sys.stdin, file_format)
+        else:
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                report = importer.run(file, file_format)
+
+        for error in report['errors']:
+            self.stderr.write(f"Строка {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано книг: {report['books']} из {report['rows']}, пропущено: {report['skipped']}"))
+
+    def report_progress(self, importer):
+        self.stdout.write(f'Обработано записей: {importer.rows}, импортировано книг: {importer.books}')
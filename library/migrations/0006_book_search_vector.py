@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_vector(apps, schema_editor):
+    """Заполняет вектор существующих книг.
+
+    Выражение зафиксировано на момент миграции (копия library.search.build_search_vector с конфигурацией
+    russian) и строится на исторических моделях, чтобы последующие правки кода поиска не меняли миграцию."""
+    Book = apps.get_model('library', 'Book')
+    Genre = apps.get_model('library', 'Genre')
+    author_names = Subquery(
+        Book.authors.through.objects.filter(book_id=OuterRef('pk'))
+        .values('book_id')
+        .annotate(names=StringAgg('author__name', delimiter=' '))
+        .values('names')[:1]
+    )
+    genre_title = Subquery(Genre.objects.filter(pk=OuterRef('genre_id')).values('title')[:1])
+    Book.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='russian')
+        + SearchVector(author_names, weight='B', config='russian')
+        + SearchVector(genre_title, weight='C', config='russian')
+        + SearchVector('description', weight='D', config='russian')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_alter_rental_deadline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:44
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_book_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='author',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='author_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='genre_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
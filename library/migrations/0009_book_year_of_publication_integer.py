@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='year_of_publication_int',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+        # Берем из строки первое отдельное число до 4 цифр ("1869", "1990-е", "изд. 2001 г."),
+        # остальные значения ("XIX век") не распознаются и становятся NULL
+        migrations.RunSQL(
+            sql=r"""
+                UPDATE library_book
+                SET year_of_publication_int = substring(year_of_publication from '\m(\d{1,4})\M')::smallint
+                WHERE year_of_publication IS NOT NULL
+            """,
+            reverse_sql="""
+                UPDATE library_book SET year_of_publication = year_of_publication_int::text
+            """,
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='year_of_publication',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='year_of_publication_int',
+            new_name='year_of_publication',
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='year_of_publication',
+            field=models.SmallIntegerField(blank=True, db_index=True, null=True, verbose_name='год издания'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_book_year_of_publication_integer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('is_returned', False)), fields=['deadline'], name='rental_open_deadline_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_rental_open_deadline_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата брони')),
+                ('fulfilled_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата выдачи по брони')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library.book', verbose_name='Книга')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+                ('rental', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='library.rental', verbose_name='Выдача по брони')),
+            ],
+            options={
+                'verbose_name': 'Бронь',
+                'verbose_name_plural': 'Брони',
+                'ordering': ('pk',),
+                'indexes': [models.Index(condition=models.Q(('fulfilled_at__isnull', True)), fields=['book', 'id'], name='hold_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('fulfilled_at__isnull', True)), fields=('reader', 'book'), name='hold_unique_active', violation_error_message='Книга уже забронирована.')],
+            },
+        ),
+    ]
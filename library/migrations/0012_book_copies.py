@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:03
+
+import django.db.models.deletion
+import django.db.models.lookups
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_hold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=64, unique=True, verbose_name='штрихкод')),
+            ],
+            options={
+                'verbose_name': 'Экземпляр книги',
+                'verbose_name_plural': 'Экземпляры книг',
+                'ordering': ('book', 'barcode'),
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='available_copies',
+            field=models.PositiveIntegerField(default=1, verbose_name='свободных экземпляров'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=1, verbose_name='экземпляров в фонде'),
+        ),
+        migrations.RunSQL(
+            sql='UPDATE library_book SET available_copies = 0 WHERE NOT is_available',
+            reverse_sql='UPDATE library_book SET is_available = available_copies > 0',
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='is_available',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='is_available',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.lookups.GreaterThan(models.F('available_copies'), 0), output_field=models.BooleanField(), verbose_name='доступна к выдаче'),
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('available_copies__lte', models.F('total_copies'))), name='book_available_copies_lte_total'),
+        ),
+        migrations.AddField(
+            model_name='bookcopy',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='library.book', verbose_name='книга'),
+        ),
+        migrations.AddField(
+            model_name='rental',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='library.bookcopy', verbose_name='Экземпляр'),
+        ),
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_returned', False)), fields=('copy',), name='rental_open_copy_unique', violation_error_message='Экземпляр уже выдан.'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_book_copies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRental',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('rental_date', models.DateTimeField(verbose_name='Дата выдачи')),
+                ('return_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата возврата')),
+                ('deadline', models.DateTimeField(blank=True, null=True, verbose_name='Срок возврата')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата переноса в архив')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library.book', verbose_name='Книга выдана')),
+                ('copy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='library.bookcopy', verbose_name='Экземпляр')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Архивная выдача',
+                'verbose_name_plural': 'Архив выдач',
+                'ordering': ('-rental_date',),
+                'indexes': [models.Index(fields=['reader', 'rental_date'], name='archived_rental_reader_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_archived_rental'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rental',
+            name='next_reminder_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Следующее напоминание о возврате'),
+        ),
+        migrations.RunSQL(
+            sql='UPDATE library_rental SET next_reminder_at = deadline WHERE NOT is_returned',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('is_returned', False)), fields=['next_reminder_at'], name='rental_next_reminder_idx'),
+        ),
+    ]
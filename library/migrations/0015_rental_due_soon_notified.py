@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_rental_next_reminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rental',
+            name='due_soon_notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Напоминание о скором сроке отправлено'),
+        ),
+    ]
@@ -1,10 +1,16 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.db.models import ForeignKey
+from django.db.models import F, ForeignKey, OuterRef
+from django.db.models.functions import Coalesce, Now
+from django.db.models.lookups import GreaterThan
 
 from config import settings
 from users.models import User
 
 NULLABLE = {"blank": True, "null": True}
+# Поля книги, которые меняются только атомарными UPDATE
+COPY_COUNTER_FIELDS = ('total_copies', 'available_copies')
 
 
 class Author(models.Model):
@@ -13,11 +19,15 @@ class Author(models.Model):
     biography = models.TextField(verbose_name='биография автора', **NULLABLE)
     country = models.CharField(max_length=100, verbose_name='из страны', **NULLABLE)
     photo = models.ImageField(upload_to='library/authors', verbose_name='Фото автора', **NULLABLE)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='дата изменения')
 
     class Meta:
         verbose_name = 'Автор'
         verbose_name_plural = 'Авторы'
         ordering = ('name',)
+        indexes = [
+            GinIndex(fields=['name'], name='author_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.name
@@ -26,10 +36,14 @@ class Genre(models.Model):
     """Модель создания жанра"""
 
     title = models.CharField(max_length=250, verbose_name='название жанра', help_text='укажите жанр', unique=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='дата изменения')
 
     class Meta:
         verbose_name = 'жанр'
         verbose_name_plural = 'жанры'
+        indexes = [
+            GinIndex(fields=['title'], name='genre_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.title
@@ -41,34 +55,195 @@ class Book(models.Model):
     title = models.CharField(max_length=250, verbose_name='название книги', help_text='Введите название книги')
     description = models.TextField(verbose_name='описание книги', help_text='Введите описание книги', **NULLABLE)
     authors = models.ManyToManyField(Author, help_text='авторы')
-    year_of_publication = models.CharField(max_length=10, verbose_name='год издания', **NULLABLE)
+    year_of_publication = models.SmallIntegerField(verbose_name='год издания', db_index=True, **NULLABLE)
     genre = ForeignKey(Genre, on_delete=models.SET_NULL, verbose_name='жанр книги', **NULLABLE)
     preview = models.ImageField(upload_to='library/books', verbose_name='Изображение книги', **NULLABLE)
-    is_available = models.BooleanField(default=True, verbose_name='доступна к выдаче')
+    total_copies = models.PositiveIntegerField(default=1, verbose_name='экземпляров в фонде')
+    available_copies = models.PositiveIntegerField(default=1, verbose_name='свободных экземпляров')
+    # Флаг хранится в строке книги и пересчитывается СУБД из счетчика, поэтому фильтр по нему не требует JOIN
+    is_available = models.GeneratedField(expression=GreaterThan(F('available_copies'), 0),
+                                         output_field=models.BooleanField(), db_persist=True,
+                                         verbose_name='доступна к выдаче')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='дата изменения')
+    search_vector = SearchVectorField(editable=False, verbose_name='поисковый вектор', **NULLABLE)
 
 
     class Meta:
         verbose_name = 'Книга'
         verbose_name_plural = 'Книги'
         ordering = ('title', 'genre',)
+        indexes = [
+            GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(available_copies__lte=F('total_copies')),
+                                   name='book_available_copies_lte_total'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """Не перезаписывает счетчики экземпляров при полном сохранении существующей книги.
+
+        Счетчики меняются только атомарными UPDATE с F() при выдаче, возврате и списании, а значения
+        в загруженном объекте могут устареть к моменту сохранения."""
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and not field.generated
+                                       and field.name not in COPY_COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
+
+class BookCopy(models.Model):
+    """Модель экземпляра книги с инвентарным штрихкодом"""
+    book = models.ForeignKey(Book, related_name='copies', verbose_name='книга', on_delete=models.CASCADE)
+    barcode = models.CharField(max_length=64, unique=True, verbose_name='штрихкод')
+
+    class Meta:
+        verbose_name = 'Экземпляр книги'
+        verbose_name_plural = 'Экземпляры книг'
+        ordering = ('book', 'barcode',)
+
+    def __str__(self):
+        return f"{self.book} ({self.barcode})"
+
+
+class RentalStatus(models.TextChoices):
+    ACTIVE = 'active', 'В аренде'
+    OVERDUE = 'overdue', 'Срок просрочен'
+    CLOSED = 'closed', 'Аренда закрыта'
+
+
+class RentalQuerySet(models.QuerySet):
+    """Выборка выдач со статусом, который вычисляется в БД по is_returned и deadline."""
+
+    @staticmethod
+    def status_condition(status):
+        """Условие на статус через исходные колонки, чтобы фильтр использовал индекс открытых выдач."""
+        if status == RentalStatus.CLOSED:
+            return models.Q(is_returned=True)
+        if status == RentalStatus.OVERDUE:
+            return models.Q(is_returned=False, deadline__lt=Now())
+        return models.Q(is_returned=False) & (models.Q(deadline__isnull=True) | models.Q(deadline__gte=Now()))
+
+    def with_status(self):
+        return self.annotate(status=models.Case(
+            models.When(self.status_condition(RentalStatus.CLOSED), then=models.Value(RentalStatus.CLOSED)),
+            models.When(self.status_condition(RentalStatus.OVERDUE), then=models.Value(RentalStatus.OVERDUE)),
+            default=models.Value(RentalStatus.ACTIVE),
+            output_field=models.CharField(),
+        ))
+
+    def filter_status(self, status):
+        return self.filter(self.status_condition(status))
+
 
 class Rental(models.Model):
     """Модель создания отметки о выдаче книги"""
     reader = models.ForeignKey(User, verbose_name="Читатель", on_delete=models.CASCADE)
     book = models.ForeignKey(Book, verbose_name="Книга выдана", on_delete=models.CASCADE)
+    copy = models.ForeignKey(BookCopy, verbose_name="Экземпляр", on_delete=models.SET_NULL, **NULLABLE)
     rental_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата выдачи")
     return_date = models.DateTimeField(verbose_name="Дата возврата", **NULLABLE)
     is_returned = models.BooleanField(default=False, verbose_name="Возвращена?")
     deadline = models.DateTimeField(help_text="Срок возврата книги", **NULLABLE)
+    next_reminder_at = models.DateTimeField(verbose_name="Следующее напоминание о возврате", editable=False,
+                                            **NULLABLE)
+    due_soon_notified_at = models.DateTimeField(verbose_name="Напоминание о скором сроке отправлено", editable=False,
+                                                **NULLABLE)
+
+    objects = RentalQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.reader} - {self.book}"
 
+    def save(self, *args, **kwargs):
+        """Первое напоминание о возврате приходится на срок возврата."""
+        if self._state.adding and self.next_reminder_at is None:
+            self.next_reminder_at = self.deadline
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Выдача"
         verbose_name_plural = "Выдачи"
         ordering = ('-rental_date',)
+        indexes = [
+            # Открытых выдач немного по сравнению с историей, поэтому индексируем только их
+            models.Index(fields=['deadline'], condition=models.Q(is_returned=False), name='rental_open_deadline_idx'),
+            # Выборка выдач, по которым пора напомнить, читает только этот индекс
+            models.Index(fields=['next_reminder_at'], condition=models.Q(is_returned=False),
+                         name='rental_next_reminder_idx'),
+        ]
+        constraints = [
+            # Экземпляр со штрихкодом может быть выдан только одному читателю одновременно
+            models.UniqueConstraint(fields=['copy'], condition=models.Q(is_returned=False),
+                                    name='rental_open_copy_unique', violation_error_message='Экземпляр уже выдан.'),
+        ]
+
+
+class ArchivedRental(models.Model):
+    """Модель закрытой выдачи, перенесенной из рабочей таблицы в архив; pk совпадает с исходной выдачей"""
+    id = models.BigIntegerField(primary_key=True)
+    reader = models.ForeignKey(User, verbose_name="Читатель", on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, verbose_name="Книга выдана", on_delete=models.CASCADE)
+    copy = models.ForeignKey(BookCopy, verbose_name="Экземпляр", on_delete=models.SET_NULL, **NULLABLE)
+    rental_date = models.DateTimeField(verbose_name="Дата выдачи")
+    return_date = models.DateTimeField(verbose_name="Дата возврата", **NULLABLE)
+    deadline = models.DateTimeField(verbose_name="Срок возврата", **NULLABLE)
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата переноса в архив")
+
+    def __str__(self):
+        return f"{self.reader} - {self.book}"
+
+    class Meta:
+        verbose_name = "Архивная выдача"
+        verbose_name_plural = "Архив выдач"
+        ordering = ('-rental_date',)
+        indexes = [
+            models.Index(fields=['reader', 'rental_date'], name='archived_rental_reader_idx'),
+        ]
+
+
+class HoldQuerySet(models.QuerySet):
+    """Выборка броней с местом в очереди на книгу."""
+
+    def active(self):
+        return self.filter(fulfilled_at__isnull=True)
+
+    def with_position(self):
+        """Место в очереди: число активных броней той же книги, оформленных раньше, плюс один."""
+        ahead = Hold.objects.active().filter(book=OuterRef('book'), pk__lt=OuterRef('pk')).order_by().values(
+            'book').annotate(count=models.Count('pk')).values('count')
+        return self.annotate(position=models.Case(
+            models.When(fulfilled_at__isnull=True, then=Coalesce(models.Subquery(ahead), 0) + 1),
+            default=None,
+            output_field=models.IntegerField(),
+        ))
+
+
+class Hold(models.Model):
+    """Модель брони: очередь читателей на выданную книгу, обслуживается в порядке оформления"""
+    reader = models.ForeignKey(User, verbose_name="Читатель", on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, verbose_name="Книга", on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата брони")
+    fulfilled_at = models.DateTimeField(verbose_name="Дата выдачи по брони", **NULLABLE)
+    rental = models.OneToOneField(Rental, verbose_name="Выдача по брони", on_delete=models.SET_NULL, **NULLABLE)
+
+    objects = HoldQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.reader} - {self.book}"
+
+    class Meta:
+        verbose_name = "Бронь"
+        verbose_name_plural = "Брони"
+        ordering = ('pk',)
+        constraints = [
+            models.UniqueConstraint(fields=['reader', 'book'], condition=models.Q(fulfilled_at__isnull=True),
+                                    name='hold_unique_active', violation_error_message='Книга уже забронирована.'),
+        ]
+        indexes = [
+            # Очередь на книгу: активные брони в порядке оформления
+            models.Index(fields=['book', 'id'], condition=models.Q(fulfilled_at__isnull=True), name='hold_queue_idx'),
+        ]
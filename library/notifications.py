@@ -0,0 +1,201 @@
+import logging
+from datetime import timedelta
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.formats import date_format
+
+from library.models import Rental
+
+logger = logging.getLogger(__name__)
+
+# Сколько выдач забирать с сервера БД за один FETCH серверного курсора
+NOTIFICATION_CHUNK_SIZE = 2000
+
+
+def due_reminders(moment):
+    """Открытые выдачи, по которым к моменту moment пора напомнить о возврате, сгруппированные по читателю.
+
+    Условие совпадает с частичным индексом rental_next_reminder_idx, поэтому стоимость выборки зависит
+    от числа напоминаний к отправке, а не от всего объема просроченных выдач."""
+    return (
+        Rental.objects
+        .filter(is_returned=False, next_reminder_at__lte=moment)
+        .select_related('book', 'reader')
+        .only('rental_date', 'deadline', 'book__title', 'reader__email')
+        .order_by('reader_id', 'pk')
+    )
+
+
+def reader_ranges(moment, readers_per_range):
+    """Делит читателей, которым к моменту moment пора напомнить, на диапазоны pk по readers_per_range читателей.
+
+    Возвращает список пар (первый pk, последний pk); пустых диапазонов не бывает."""
+    reader_ids = (Rental.objects.filter(is_returned=False, next_reminder_at__lte=moment)
+                  .order_by('reader_id').values_list('reader_id', flat=True).distinct())
+    ranges = []
+    chunk = []
+    for reader_id in reader_ids.iterator(chunk_size=NOTIFICATION_CHUNK_SIZE):
+        chunk.append(reader_id)
+        if len(chunk) >= readers_per_range:
+            ranges.append((chunk[0], chunk[-1]))
+            chunk = []
+    if chunk:
+        ranges.append((chunk[0], chunk[-1]))
+    return ranges
+
+
+def next_reminder(moment):
+    """Время следующего напоминания после отправки в moment; None, если напоминание отправляется один раз."""
+    interval = settings.OVERDUE_REMINDER_INTERVAL
+    return moment + interval if interval else None
+
+
+def group_by_reader(rentals):
+    """Лениво группирует выдачи, упорядоченные по читателю, в пары (читатель, список выдач)."""
+    for _, group in groupby(rentals, key=lambda rental: rental.reader_id):
+        group = list(group)
+        yield group[0].reader, group
+
+
+def overdue_message(reader, rentals):
+    """Одно письмо читателю со всеми просроченными книгами."""
+    lines = [
+        f'«{rental.book.title}», взята {date_format(timezone.localtime(rental.rental_date), "SHORT_DATE_FORMAT")}, '
+        f'срок возврата {date_format(timezone.localtime(rental.deadline), "SHORT_DATE_FORMAT")}'
+        for rental in rentals
+    ]
+    books = '\n'.join(lines)
+    return EmailMessage(
+        subject='Срок возвращения арендованных книг истек' if len(rentals) > 1 else
+        f'Срок возвращения арендованной книги: {rentals[0].book.title}',
+        body=f'Здравствуйте! Пришло время вернуть в библиотеку книги:\n{books}\nСпасибо за понимание.',
+        from_email=settings.EMAIL_HOST_USER,
+        to=[reader.email],
+    )
+
+
+def claim(rentals, moment):
+    """Переносит напоминание по выдачам на следующий срок и возвращает pk тех, что удалось забрать.
+
+    Выдачи, которые уже забрал параллельный запуск или которые успели изменить, пропускаются,
+    поэтому одно напоминание не отправляется дважды."""
+    with transaction.atomic():
+        claimed = set(
+            Rental.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=[rental.pk for rental in rentals], is_returned=False, next_reminder_at__lte=moment)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        Rental.objects.filter(pk__in=claimed).update(next_reminder_at=next_reminder(moment))
+    return claimed
+
+
+def release(pks, moment):
+    """Возвращает выдачи в очередь напоминаний после неудачной отправки."""
+    Rental.objects.filter(pk__in=pks, is_returned=False).update(next_reminder_at=moment)
+
+
+def send_reminders(rentals, moment, batch_size=None):
+    """Отправляет напоминания пачками по batch_size читателей через одно соединение с почтовым сервером на пачку.
+
+    Перед отправкой выдачи пачки забираются через claim(), при ошибке отправки возвращаются обратно.
+    Возвращает словарь с числом отправленных и неотправленных писем."""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    result = {'sent': 0, 'failed': 0}
+    batch = []
+    for group in group_by_reader(rentals):
+        batch.append(group)
+        if len(batch) >= batch_size:
+            _send_batch(batch, moment, result)
+            batch = []
+    if batch:
+        _send_batch(batch, moment, result)
+    return result
+
+
+def _send_batch(batch, moment, result):
+    claimed = claim([rental for _, group in batch for rental in group], moment)
+    messages = []
+    for reader, group in batch:
+        group = [rental for rental in group if rental.pk in claimed]
+        if group:
+            messages.append(overdue_message(reader, group))
+    if not messages:
+        return
+    try:
+        with get_connection() as connection:
+            result['sent'] += connection.send_messages(messages) or 0
+    except Exception:
+        logger.exception('Не удалось отправить напоминания о возврате книг')
+        release(claimed, moment)
+        result['failed'] += len(messages)
+
+
+def due_soon_digests(moment):
+    """Сводки по читателям, у которых в ближайшие DUE_SOON_REMINDER_DAYS дней истекает срок возврата книг.
+
+    Один сгруппированный запрос возвращает по строке на читателя с названиями книг, сроками и pk выдач,
+    упорядоченными по сроку. Условие по сроку опирается на частичный индекс rental_open_deadline_idx;
+    выдачи, о которых уже напомнили, пропускаются."""
+    return (
+        Rental.objects
+        .filter(is_returned=False, deadline__gt=moment,
+                deadline__lte=moment + timedelta(days=settings.DUE_SOON_REMINDER_DAYS),
+                due_soon_notified_at__isnull=True)
+        .order_by('reader_id')
+        .values('reader_id', 'reader__email')
+        .annotate(
+            titles=ArrayAgg('book__title', order_by=('deadline', 'pk')),
+            deadlines=ArrayAgg('deadline', order_by=('deadline', 'pk')),
+            rentals=ArrayAgg('pk', order_by=('deadline', 'pk')),
+        )
+    )
+
+
+def in_send_window(moment):
+    """Попадает ли moment по местному времени в часы отправки сводок DUE_SOON_SEND_WINDOW."""
+    start, end = settings.DUE_SOON_SEND_WINDOW
+    return start <= timezone.localtime(moment).hour < end
+
+
+def due_soon_message(digest):
+    """Одно письмо читателю со всеми книгами, срок возврата которых скоро истекает."""
+    books = '\n'.join(
+        f'«{title}», срок возврата {date_format(timezone.localtime(deadline), "SHORT_DATE_FORMAT")}'
+        for title, deadline in zip(digest['titles'], digest['deadlines'])
+    )
+    return EmailMessage(
+        subject='Скоро истекает срок возврата книг' if len(digest['titles']) > 1 else
+        f'Скоро истекает срок возврата книги: {digest["titles"][0]}',
+        body=f'Здравствуйте! Напоминаем, что скоро нужно вернуть в библиотеку книги:\n{books}\n'
+             f'Если книга еще нужна, продлите выдачу у библиотекаря.',
+        from_email=settings.EMAIL_HOST_USER,
+        to=[digest['reader__email']],
+    )
+
+
+def send_due_soon_digests(moment, batch_size=None):
+    """Отправляет сводки о скором сроке возврата пачками по batch_size читателей.
+
+    После успешной отправки пачки ее выдачи помечаются одним UPDATE, поэтому повторный запуск
+    не напоминает о них снова; при ошибке отправки пачка остается в очереди до следующего запуска.
+    Возвращает словарь с числом отправленных и неотправленных писем."""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    result = {'sent': 0, 'failed': 0}
+    digests = due_soon_digests(moment).iterator(chunk_size=NOTIFICATION_CHUNK_SIZE)
+    while batch := list(islice(digests, batch_size)):
+        messages = [due_soon_message(digest) for digest in batch]
+        try:
+            with get_connection() as connection:
+                result['sent'] += connection.send_messages(messages) or 0
+        except Exception:
+            logger.exception('Не удалось отправить напоминания о скором сроке возврата книг')
+            result['failed'] += len(messages)
+            continue
+        Rental.objects.filter(pk__in=[pk for digest in batch for pk in digest['rentals']]).update(
+            due_soon_notified_at=moment)
+    return result
@@ -1,8 +0,0 @@
-from rest_framework.pagination import PageNumberPagination
-
-
-class Paginator(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
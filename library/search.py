@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+
+
+def build_search_vector(book_model):
+    """Возвращает выражение tsvector для книги: название, авторы, жанр и описание с весами A-D."""
+    config = settings.SEARCH_CONFIG
+    through = book_model.authors.through
+    genre_model = book_model._meta.get_field('genre').related_model
+
+    author_names = Subquery(
+        through.objects.filter(book_id=OuterRef('pk'))
+        .values('book_id')
+        .annotate(names=StringAgg('author__name', delimiter=' '))
+        .values('names')[:1]
+    )
+    genre_title = Subquery(genre_model.objects.filter(pk=OuterRef('genre_id')).values('title')[:1])
+
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector(author_names, weight='B', config=config)
+        + SearchVector(genre_title, weight='C', config=config)
+        + SearchVector('description', weight='D', config=config)
+    )
+
+
+def update_search_vector(queryset):
+    """Пересчитывает поисковый вектор для книг из queryset одним UPDATE."""
+    return queryset.update(search_vector=build_search_vector(queryset.model))
+
+
+def search_books(queryset, text):
+    """Фильтрует книги по полнотекстовому запросу и сортирует их по релевантности."""
+    query = SearchQuery(text, search_type='websearch', config=settings.SEARCH_CONFIG)
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', 'pk')
+    )
+
+
+def autocomplete(queryset, field, text, limit):
+    """Подбирает записи по нечеткому совпадению начала слов (pg_trgm) и сортирует их по похожести."""
+    return (
+        queryset.filter(**{f'{field}__trigram_word_similar': text})
+        .annotate(similarity=TrigramWordSimilarity(text, field))
+        .order_by('-similarity', field)
+        .values('pk', field, 'similarity')[:limit]
+    )
+
+
+def book_facets(queryset):
+    """Считает фасеты по жанру, доступности и году издания для отфильтрованных книг одним запросом.
+
+    Отфильтрованный queryset становится подзапросом, а счетчики по всем измерениям и общий итог
+    собираются одним GROUP BY GROUPING SETS."""
+    inner = queryset.prefetch_related(None).order_by().values(
+        'genre_id', 'genre__title', 'is_available', 'year_of_publication')
+    sql, params = inner.query.sql_with_params()
+    facets_sql = f'''
+        SELECT facet.genre_id, facet.title, facet.is_available, facet.year_of_publication,
+               GROUPING(facet.genre_id, facet.title), GROUPING(facet.is_available),
+               GROUPING(facet.year_of_publication), COUNT(*)
+        FROM ({sql}) AS facet (genre_id, title, is_available, year_of_publication)
+        GROUP BY GROUPING SETS ((facet.genre_id, facet.title), (facet.is_available), (facet.year_of_publication), ())
+    '''
+    result = {'count': 0, 'genres': [], 'availability': [], 'years': []}
+    with connection.cursor() as cursor:
+        cursor.execute(facets_sql, params)
+        for genre_id, title, is_available, year, no_genre, no_availability, no_year, count in cursor.fetchall():
+            if no_genre and no_availability and no_year:
+                result['count'] = count
+            elif not no_genre:
+                result['genres'].append({'id': genre_id, 'title': title, 'count': count})
+            elif not no_availability:
+                result['availability'].append({'is_available': is_available, 'count': count})
+            else:
+                result['years'].append({'year': year, 'count': count})
+    result['genres'].sort(key=lambda facet: (-facet['count'], facet['title'] or ''))
+    result['availability'].sort(key=lambda facet: not facet['is_available'])
+    result['years'].sort(key=lambda facet: (facet['year'] is None, facet['year'] or 0))
+    return result
@@ -1,23 +1,60 @@
-from rest_framework.fields import SerializerMethodField
-from rest_framework.serializers import ModelSerializer
+from django.db import transaction
+from rest_framework.fields import (BooleanField, ChoiceField, CurrentUserDefault, DateTimeField, IntegerField, ListField,
+                                   SerializerMethodField)
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import ModelSerializer, Serializer, ValidationError
 
-from library.models import Author, Genre, Book, Rental
-from users.serializers import UserSerializer
+from common.sparse_fields import SparseFieldsMixin, parse_sparse_fields
+from library.circulation import BULK_MAX_ITEMS, change_copies
+from library.models import Author, Genre, Book, Hold, Rental, RentalStatus
+from users.models import User
+from users.serializers import UserShortSerializer
 
 
-class AuthorSerializer(ModelSerializer):
+class ExpandableFieldsMixin:
+    """Заменяет связанные поля вложенными сериализаторами по параметру ?expand=поле1,поле2.
+
+    expandable_fields задает для поля пару (класс сериализатора, аргументы)."""
+    expand_query_param = 'expand'
+    expandable_fields = {}
+
+    @classmethod
+    def get_expand(cls, request):
+        """Возвращает множество полей, которые нужно развернуть для запроса."""
+        if request is None or request.method not in SAFE_METHODS:
+            return set()
+        names = request.query_params.get(cls.expand_query_param, '')
+        expand = {name.strip() for name in names.split(',')} & set(cls.expandable_fields)
+        only, omit = parse_sparse_fields(request)
+        if only is not None:
+            expand &= only
+        return expand - omit
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.get_expand(self.context.get('request')):
+            serializer_class, options = self.expandable_fields[name]
+            self.fields[name] = serializer_class(read_only=True, **options)
+
+
+class AuthorSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Author
         fields = '__all__'
 
 
-class GenreSerializer(ModelSerializer):
+class GenreSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Genre
         fields = '__all__'
 
 
-class BookSerializer(ModelSerializer):
+class BookSerializer(SparseFieldsMixin, ExpandableFieldsMixin, ModelSerializer):
+    expandable_fields = {
+        'authors': (AuthorSerializer, {'many': True}),
+        'genre': (GenreSerializer, {}),
+    }
 
     class Meta:
         model = Book
@@ -27,12 +64,43 @@ class BookSerializer(ModelSerializer):
             'genre',
             'authors',
             'year_of_publication',
+            'total_copies',
+            'available_copies',
+            'is_available',
+            'updated_at',
         )
+        read_only_fields = ('available_copies', 'is_available',)
+
+    def create(self, validated_data):
+        validated_data['available_copies'] = validated_data.get('total_copies', 1)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        """Изменение числа экземпляров применяется атомарно через change_copies, а не перезаписью счетчиков."""
+        total_copies = validated_data.pop('total_copies', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if total_copies is not None and total_copies != instance.total_copies:
+                change_copies(instance, total_copies - instance.total_copies)
+        return instance
+
 
+class ChoiceLabelField(ChoiceField):
+    """Отдает подпись значения из choices вместо самого значения."""
 
-class RentalSerializer(ModelSerializer):
-    reader = UserSerializer
-    book = BookSerializer
+    def to_representation(self, value):
+        return self.choices.get(value, value)
+
+
+class RentalSerializer(SparseFieldsMixin, ExpandableFieldsMixin, ModelSerializer):
+    expandable_fields = {
+        'reader': (UserShortSerializer, {}),
+        'book': (BookSerializer, {}),
+    }
+    # Аннотация RentalQuerySet.with_status(); у только что созданной выдачи ее нет, и поле пропускается
+    status = ChoiceField(choices=RentalStatus.choices, read_only=True)
+    # Русская подпись статуса, которую до появления кодов отдавала карточка аренды
+    status_display = ChoiceLabelField(source='status', choices=RentalStatus.choices, read_only=True)
 
     class Meta:
         model = Rental
@@ -44,5 +112,92 @@ class RentalSerializer(ModelSerializer):
             'is_returned',
             'deadline',
             'return_date',
+            'copy',
+            'status',
+            'status_display',
+        )
+
+    # Книга, читатель и экземпляр задаются только при выдаче: их смена у существующей выдачи
+    # прошла бы мимо счетчиков доступных экземпляров
+    create_only_fields = ('reader', 'book', 'copy')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            for name in self.create_only_fields:
+                if name in fields:
+                    fields[name].read_only = True
+        return fields
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        copy = attrs.get('copy')
+        if copy is not None and copy.book_id != attrs['book'].pk:
+            raise ValidationError('Экземпляр относится к другой книге.')
+        return attrs
+
+
+class RentalHistorySerializer(Serializer):
+    """Запись истории выдач из library.archive.rental_history: рабочая или архивная выдача."""
+    pk = IntegerField()
+    reader = IntegerField()
+    book = IntegerField()
+    copy = IntegerField(allow_null=True)
+    rental_date = DateTimeField()
+    return_date = DateTimeField(allow_null=True)
+    deadline = DateTimeField(allow_null=True)
+    returned = BooleanField()
+    archived = BooleanField()
+
+
+class HoldSerializer(SparseFieldsMixin, ModelSerializer):
+    reader = PrimaryKeyRelatedField(queryset=User.objects.all(), default=CurrentUserDefault())
+    # Аннотация HoldQuerySet.with_position(); для исполненной брони равна None
+    position = IntegerField(read_only=True)
+
+    class Meta:
+        model = Hold
+        fields = (
+            'pk',
+            'reader',
+            'book',
+            'created_at',
+            'fulfilled_at',
+            'rental',
+            'position',
         )
+        read_only_fields = ('fulfilled_at', 'rental',)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if Hold.objects.active().filter(reader=attrs['reader'], book=attrs['book']).exists():
+            raise ValidationError('Книга уже забронирована.')
+        if Rental.objects.filter(reader=attrs['reader'], book=attrs['book'], is_returned=False).exists():
+            raise ValidationError('Книга уже выдана этому читателю.')
+        return attrs
+
+
+def validate_existing_ids(model, ids):
+    """Убирает повторы из списка pk и проверяет одним запросом, что все записи существуют."""
+    ids = list(dict.fromkeys(ids))
+    missing = set(ids) - set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+    if missing:
+        raise ValidationError(f'Не найдены записи: {", ".join(str(pk) for pk in sorted(missing))}.')
+    return ids
+
+
+class BulkCheckoutSerializer(Serializer):
+    """Массовая выдача книг одному читателю."""
+    reader = PrimaryKeyRelatedField(queryset=User.objects.all())
+    books = ListField(child=IntegerField(min_value=1), min_length=1, max_length=BULK_MAX_ITEMS)
+
+    def validate_books(self, value):
+        return validate_existing_ids(Book, value)
+
+
+class BulkReturnSerializer(Serializer):
+    """Массовый возврат книг по списку аренд."""
+    rentals = ListField(child=IntegerField(min_value=1), min_length=1, max_length=BULK_MAX_ITEMS)
 
+    def validate_rentals(self, value):
+        return validate_existing_ids(Rental, value)
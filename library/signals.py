@@ -0,0 +1,83 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from library import cache
+from library.models import Author, Book, Genre
+from library.search import update_search_vector
+
+# Поля доступности книги: их изменение не влияет на поисковый вектор и на списки, где этих полей нет
+AVAILABILITY_FIELDS = {'available_copies', 'is_available'}
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, update_fields=None, **kwargs):
+    """Обновляет поисковый вектор сохраненной книги и инвалидирует ее кэш."""
+    if update_fields and set(update_fields) <= AVAILABILITY_FIELDS:
+        cache.invalidate_books([instance.pk], availability_only=True)
+        return
+    update_search_vector(Book.objects.filter(pk=instance.pk))
+    cache.invalidate_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    """Инвалидирует кэш удаленной книги."""
+    cache.invalidate_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Обновляет поисковый вектор книг при изменении списка авторов."""
+    if reverse and action == 'pre_clear':
+        # При очистке со стороны автора pk_set не передается, поэтому запоминаем книги заранее
+        instance._search_book_ids = list(Book.objects.filter(authors=instance).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        book_ids = [instance.pk]
+    elif action == 'post_clear':
+        book_ids = getattr(instance, '_search_book_ids', [])
+    else:
+        book_ids = list(pk_set)
+    update_search_vector(Book.objects.filter(pk__in=book_ids))
+    cache.invalidate_books(book_ids)
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, **kwargs):
+    """Обновляет поисковый вектор и кэш книг автора при изменении его данных."""
+    cache.bump(cache.AUTHORS)
+    if not created:
+        book_ids = list(Book.objects.filter(authors=instance).values_list('pk', flat=True))
+        update_search_vector(Book.objects.filter(pk__in=book_ids))
+        cache.invalidate_books(book_ids)
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, created, **kwargs):
+    """Обновляет поисковый вектор и кэш книг жанра при изменении его названия."""
+    cache.bump(cache.GENRES)
+    if not created:
+        book_ids = list(Book.objects.filter(genre=instance).values_list('pk', flat=True))
+        update_search_vector(Book.objects.filter(pk__in=book_ids))
+        cache.invalidate_books(book_ids)
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def remember_related_books(sender, instance, **kwargs):
+    """Запоминает книги удаляемого автора или жанра до удаления связей."""
+    lookup = 'authors' if sender is Author else 'genre'
+    instance._search_book_ids = list(Book.objects.filter(**{lookup: instance}).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def related_deleted(sender, instance, **kwargs):
+    """Обновляет поисковый вектор и кэш книг после удаления автора или жанра."""
+    cache.bump(cache.AUTHORS if sender is Author else cache.GENRES)
+    book_ids = getattr(instance, '_search_book_ids', None)
+    if book_ids:
+        update_search_vector(Book.objects.filter(pk__in=book_ids))
+        cache.invalidate_books(book_ids)
@@ -1,22 +1,72 @@
-from celery import shared_task
-from django.core.mail import send_mail
+import logging
+from datetime import datetime
+
+from celery import chord, current_app, group, shared_task
+from django.conf import settings
 from django.utils import timezone
 
-from config import settings
-from library.models import Rental
+from library.archive import archive_closed_rentals
+from library.notifications import (NOTIFICATION_CHUNK_SIZE, due_reminders, in_send_window, reader_ranges,
+                                   send_due_soon_digests as send_digests, send_reminders)
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def checking_deadline():
-    """This task is scheduled to run every day.
-    It checks the expiration date of rentals and sends an email to renters if the rental period is over."""
-    rents = Rental.objects.filter(deadline__lte=timezone.now(), is_returned=False)
-    if rents:
-        for rent in rents:
-            send_mail(
-                subject=f"Срок возвращения арендованной книги: {rent.book.title}",
-                message=f"""Здравствуйте! {rent.rental_date} Вами взята из библиотеки книга {rent.book.title}. 
-                Пришло время ее вернуть. Спасибо за понимание.""",
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=rent.reader.email,
-            )
+    """This task is scheduled to run every 30 minutes.
+    It is a coordinator: readers with overdue rentals due for a reminder are split into contiguous reader pk ranges,
+    and each range is handled by send_overdue_reminders in a Celery chord, so the work spreads across workers
+    and nodes instead of running serially. Partitioning by reader keeps one email per reader per run.
+    summarize_reminders receives the per-range counts when all chunks are done; when CELERY_RESULT_BACKEND
+    is not configured the chunks are dispatched as a plain group instead."""
+    moment = timezone.now()
+    ranges = reader_ranges(moment, settings.NOTIFICATION_READERS_PER_TASK)
+    chunks = [send_overdue_reminders.s(first, last, moment.isoformat()) for first, last in ranges]
+    if chunks and current_app.conf.result_backend:
+        chord(chunks)(summarize_reminders.s())
+    elif chunks:
+        # A chord needs a result backend; without one the chunks run as a plain group and each logs its own counts
+        group(chunks).apply_async()
+    return {'chunks': len(ranges)}
+
+
+@shared_task(rate_limit=settings.NOTIFICATION_TASK_RATE_LIMIT)
+def send_overdue_reminders(first_reader_id, last_reader_id, moment):
+    """Sends reminders to readers with pk in [first_reader_id, last_reader_id] that were due at moment.
+    The rate limit caps how many chunks a worker starts per unit of time, bounding the load on the mail server."""
+    moment = datetime.fromisoformat(moment)
+    rentals = due_reminders(moment).filter(reader_id__gte=first_reader_id, reader_id__lte=last_reader_id)
+    result = send_reminders(rentals.iterator(chunk_size=NOTIFICATION_CHUNK_SIZE), moment)
+    logger.info('Напоминания о возврате книг читателям %s-%s: %s', first_reader_id, last_reader_id, result)
+    return result
+
+
+@shared_task
+def summarize_reminders(results):
+    """Sums up the per-chunk counts of sent and failed reminders."""
+    summary = {'chunks': len(results), 'sent': 0, 'failed': 0}
+    for result in results:
+        summary['sent'] += result['sent']
+        summary['failed'] += result['failed']
+    logger.info('Напоминания о возврате книг: %s', summary)
+    return summary
+
+
+@shared_task
+def send_due_soon_digests():
+    """This task is scheduled to run every hour.
+    Readers whose rentals expire within DUE_SOON_REMINDER_DAYS get one digest email listing all such books.
+    Digests are sent only inside DUE_SOON_SEND_WINDOW local hours; each rental is included in a digest once."""
+    moment = timezone.now()
+    if not in_send_window(moment):
+        return {'skipped': True}
+    result = send_digests(moment)
+    logger.info('Напоминания о скором сроке возврата книг: %s', result)
+    return result
+
+
+@shared_task
+def archive_rentals():
+    """Переносит закрытые выдачи старше RENTAL_ARCHIVE_AFTER в архивную таблицу и возвращает их число."""
+    return archive_closed_rentals()
@@ -1,11 +1,37 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils.timezone import now
 
+import base64
+import csv
+import gzip
+import json
+import tempfile
+import threading
+from io import StringIO
+from unittest.mock import PropertyMock, patch
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.fields import DateTimeField
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
 
-from library.models import Book, Author, Genre, Rental
+from common.throttling import take_token
+from config import celery_app
+from library.archive import archive_closed_rentals
+from library.cache import BOOK_LIST, book_detail, get_markers
+from library.notifications import due_soon_digests, reader_ranges
+from library.tasks import checking_deadline, send_due_soon_digests, send_overdue_reminders, summarize_reminders
+from library.models import ArchivedRental, Book, BookCopy, Author, Genre, Hold, Rental
 from users.models import User
 
 
@@ -96,7 +122,8 @@ class AuthorTestCase(APITestCase):
         response = self.client.get(url)
         data = response.json()
         result = {'count': 1, 'next': None, 'previous': None,
-                  'results': [{'id': 7, 'name': 'Author1', 'biography': None, 'country': 'Country1', 'photo': None}]}
+                  'results': [{'id': self.author.pk, 'name': 'Author1', 'biography': None, 'country': 'Country1',
+                               'photo': None, 'updated_at': DateTimeField().to_representation(self.author.updated_at)}]}
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
 
@@ -108,6 +135,115 @@ class AuthorTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.usual_user = User.objects.create(email='user@user.com')
+        self.authors = [Author.objects.create(name=f'Author{i}') for i in range(2)]
+        self.books = []
+        for i in range(3):
+            book = Book.objects.create(title=f'Книга {i}')
+            book.authors.set(self.authors)
+            self.books.append(book)
+        self.rental = Rental.objects.create(book=self.books[0], reader=self.usual_user)
+
+    def read_stream(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_export_books_ndjson(self):
+        """Тест потоковой выгрузки книг в NDJSON"""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('library:books-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.read_stream(response).decode('utf-8').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [book.pk for book in self.books])
+        self.assertEqual(rows[0]['title'], 'Книга 0')
+        self.assertEqual(rows[0]['author_ids'], [author.pk for author in self.authors])
+
+    def test_export_rentals_csv_gzip(self):
+        """Тест потоковой выгрузки выдач в CSV со сжатием gzip"""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('library:rent-export'), {'export_format': 'csv', 'compress': 'gzip'},
+                                   HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('rentals.csv.gz', response['Content-Disposition'])
+        rows = list(csv.DictReader(gzip.decompress(self.read_stream(response)).decode('utf-8').splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['book_id'], str(self.books[0].pk))
+        self.assertEqual(rows[0]['is_returned'], 'False')
+
+    def test_export_usual_user(self):
+        """Тест выгрузки у обычного пользователя"""
+        self.client.force_authenticate(user=self.usual_user)
+        response = self.client.get(reverse('library:authors-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+
+    def test_export_invalid_format(self):
+        """Тест выгрузки в неподдерживаемом формате"""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('library:rent-export'), {'export_format': 'xml'}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), {'export_format': 'Поддерживаются форматы ndjson и csv.'})
+
+    def test_export_catalog_command(self):
+        """Тест команды export_catalog"""
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as file:
+            call_command('export_catalog', 'authors', '--output', file.name, stderr=StringIO())
+            rows = [json.loads(line) for line in file.read().decode('utf-8').splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Author0', 'Author1'])
+
+
+class FacetsTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.novel = Genre.objects.create(title='Роман')
+        self.poetry = Genre.objects.create(title='Поэзия')
+        Book.objects.create(title='Война и мир', genre=self.novel, year_of_publication=1869)
+        Book.objects.create(title='Анна Каренина', genre=self.novel, year_of_publication=1877, available_copies=0)
+        Book.objects.create(title='Стихотворения', genre=self.poetry, year_of_publication=1869)
+        Book.objects.create(title='Без жанра')
+        self.url = reverse('library:books-facets')
+
+    def test_facets(self):
+        """Тест фасетов по всему каталогу одним запросом"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'count': 4,
+            'genres': [
+                {'id': self.novel.pk, 'title': 'Роман', 'count': 2},
+                {'id': None, 'title': None, 'count': 1},
+                {'id': self.poetry.pk, 'title': 'Поэзия', 'count': 1},
+            ],
+            'availability': [{'is_available': True, 'count': 3}, {'is_available': False, 'count': 1}],
+            'years': [{'year': 1869, 'count': 2}, {'year': 1877, 'count': 1}, {'year': None, 'count': 1}],
+        })
+
+    def test_facets_with_filters(self):
+        """Тест фасетов с фильтром и полнотекстовым поиском"""
+        response = self.client.get(self.url, {'is_available': True, 'q': 'война'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['genres'], [{'id': self.novel.pk, 'title': 'Роман', 'count': 1}])
+
+    def test_facets_cache_invalidated(self):
+        """Тест пересчета фасетов после выдачи книги"""
+        self.client.get(self.url)
+        book = Book.objects.get(title='Война и мир')
+        with self.captureOnCommitCallbacks(execute=True):
+            book.available_copies = 0
+            book.save(update_fields=['available_copies'])
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['availability'], [{'is_available': True, 'count': 2},
+                                                         {'is_available': False, 'count': 2}])
+
+
 class GenreTestCase(APITestCase):
     def setUp(self):
         """Подготовка данных перед тестом"""
@@ -204,6 +340,98 @@ class GenreTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class RentalArchiveTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.reader = User.objects.create(email='user@user.com')
+        self.other_reader = User.objects.create(email='other@user.com')
+        self.book = Book.objects.create(title='Book1')
+        long_ago = now() - timedelta(days=400)
+        self.old_rentals = [Rental.objects.create(book=self.book, reader=self.reader, is_returned=True,
+                                                  return_date=long_ago) for _ in range(5)]
+        self.recent = Rental.objects.create(book=self.book, reader=self.reader, is_returned=True, return_date=now())
+        self.open = Rental.objects.create(book=self.book, reader=self.other_reader)
+        self.hold = Hold.objects.create(book=self.book, reader=self.reader, fulfilled_at=long_ago,
+                                        rental=self.old_rentals[0])
+
+    def test_archive_closed_rentals(self):
+        """Тест переноса старых закрытых выдач в архив пачками"""
+        self.assertEqual(archive_closed_rentals(batch_size=2), 5)
+        self.assertEqual(set(Rental.objects.values_list('pk', flat=True)), {self.recent.pk, self.open.pk})
+        self.assertEqual(set(ArchivedRental.objects.values_list('pk', flat=True)),
+                         {rental.pk for rental in self.old_rentals})
+        self.hold.refresh_from_db()
+        self.assertIsNone(self.hold.rental)
+        self.assertEqual(archive_closed_rentals(), 0)
+
+    def test_history(self):
+        """Тест истории выдач читателя из рабочей и архивной таблиц"""
+        archive_closed_rentals()
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(reverse('library:rent-history'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual([item['archived'] for item in response.data['results']], [False] + [True] * 5)
+        self.assertTrue(all(item['reader'] == self.reader.pk for item in response.data['results']))
+
+    def test_history_staff(self):
+        """Тест истории выдач другого читателя для библиотекаря"""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('library:rent-history'), {'reader': self.other_reader.pk})
+        self.assertEqual([item['pk'] for item in response.data['results']], [self.open.pk])
+        self.assertFalse(response.data['results'][0]['returned'])
+
+
+class AutocompleteTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.usual_user = User.objects.create(email='user@user.com')
+        self.tolstoy = Author.objects.create(name='Лев Толстой')
+        self.tolstaya = Author.objects.create(name='Татьяна Толстая')
+        Author.objects.create(name='Антон Чехов')
+        self.genre = Genre.objects.create(title='Фантастика')
+        Genre.objects.create(title='Детектив')
+
+    def test_autocomplete_authors(self):
+        """Тест автодополнения авторов с сортировкой по похожести"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:authors-autocomplete')
+        response = self.client.get(url, {'q': 'Толстой'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([author['pk'] for author in response.data], [self.tolstoy.pk, self.tolstaya.pk])
+
+    def test_autocomplete_authors_typo_and_limit(self):
+        """Тест автодополнения авторов с опечаткой и ограничением количества"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:authors-autocomplete')
+        response = self.client.get(url, {'q': 'Толстй', 'limit': 1})
+        self.assertEqual([author['pk'] for author in response.data], [self.tolstoy.pk])
+
+    def test_autocomplete_genres(self):
+        """Тест автодополнения жанров"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:genres-autocomplete')
+        response = self.client.get(url, {'q': 'фантаст'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([genre['pk'] for genre in response.data], [self.genre.pk])
+
+    def test_autocomplete_invalid_limit(self):
+        """Тест автодополнения с невалидным лимитом"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:genres-autocomplete')
+        response = self.client.get(url, {'q': 'фантаст', 'limit': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_usual_user(self):
+        """Тест автодополнения у обычного пользователя"""
+        self.client.force_authenticate(user=self.usual_user)
+        url = reverse('library:authors-autocomplete')
+        response = self.client.get(url, {'q': 'Толстой'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
 class BookTestCase(APITestCase):
     def setUp(self):
         """Подготовка данных перед тестом"""
@@ -272,7 +500,11 @@ class BookTestCase(APITestCase):
         response = self.client.get(url)
         data = response.json()
         result = {'count': 1, 'next': None, 'previous': None,
-                  'results': [{'pk': 6, 'title': 'Book1', 'genre': 5, 'authors': [19], 'year_of_publication': None}]}
+                  'results': [{'pk': self.book.pk, 'title': 'Book1', 'genre': self.genre.pk,
+                               'authors': [author.pk for author in self.book.authors.all()],
+                               'year_of_publication': None, 'total_copies': 1, 'available_copies': 1,
+                               'is_available': True,
+                               'updated_at': DateTimeField().to_representation(self.book.updated_at)}]}
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
         self.assertEqual(len(response.data.get('results')), 1)
@@ -287,6 +519,913 @@ class BookTestCase(APITestCase):
         self.assertEqual(Book.objects.get(pk=self.book.pk).title, 'Book2')
 
 
+class BookCacheTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.author = Author.objects.create(name='Author1')
+        self.book = Book.objects.create(title='Book1')
+        self.book.authors.add(self.author)
+        self.list_url = reverse('library:books-list')
+        self.detail_url = reverse('library:books-detail', kwargs={'pk': self.book.pk})
+
+    def test_list_cached(self):
+        """Тест повторного запроса списка книг без обращения к базе"""
+        self.client.get(self.list_url, {'page_size': 5, 'title': 'Book1'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url, {'title': 'Book1', 'page_size': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_book_update_invalidates(self):
+        """Тест инвалидации списка и карточки книги при ее изменении"""
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Book2'
+            self.book.save()
+        self.assertEqual(self.client.get(self.list_url).data['results'][0]['title'], 'Book2')
+        self.assertEqual(self.client.get(self.detail_url).data['title'], 'Book2')
+
+    def test_detail_pk_normalized(self):
+        """Тест инвалидации карточки, запрошенной по pk с ведущим нулем, и карточки по нечисловому pk"""
+        url = reverse('library:books-detail', kwargs={'pk': f'0{self.book.pk}'})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Book2'
+            self.book.save()
+        self.assertEqual(self.client.get(url).data['title'], 'Book2')
+        response = self.client.get(reverse('library:books-detail', kwargs={'pk': 'abc'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalidation_waits_for_commit(self):
+        """Тест: версии кэша меняются только после коммита транзакции, изменившей книгу"""
+        namespaces = [BOOK_LIST, book_detail(self.book.pk)]
+        versions, _ = get_markers(namespaces)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book.title = 'Book2'
+            self.book.save()
+        self.assertEqual(get_markers(namespaces)[0], versions)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_markers(namespaces)[0], versions)
+
+    def test_author_update_invalidates(self):
+        """Тест инвалидации развернутых авторов при переименовании автора"""
+        self.client.get(self.detail_url, {'expand': 'authors'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.name = 'Author2'
+            self.author.save()
+        response = self.client.get(self.detail_url, {'expand': 'authors'})
+        self.assertEqual(response.data['authors'][0]['name'], 'Author2')
+
+    def test_related_change_keeps_other_books(self):
+        """Тест: новая книга с авторами и правка автора не сбрасывают карточки несвязанных книг"""
+        genre = Genre.objects.create(title='Genre1')
+        Book.objects.filter(pk=self.book.pk).update(genre=genre)
+        other = Book.objects.create(title='Other')
+        other_url = reverse('library:books-detail', kwargs={'pk': other.pk})
+        self.client.get(other_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title='Book3').authors.add(self.author)
+            self.author.name = 'Author2'
+            self.author.save()
+            genre.title = 'Genre2'
+            genre.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(other_url).data['title'], 'Other')
+
+    def test_availability_change_is_precise(self):
+        """Тест: изменение доступности сбрасывает только списки, которые от нее зависят"""
+        self.client.get(self.list_url, {'fields': 'pk,title'})
+        self.client.get(self.list_url)
+        self.client.get(self.list_url, {'is_available': True})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.available_copies = 0
+            self.book.save(update_fields=['available_copies'])
+        with self.assertNumQueries(0):
+            self.client.get(self.list_url, {'fields': 'pk,title'})
+        self.assertEqual(self.client.get(self.list_url, {'is_available': True}).data['count'], 0)
+        self.assertFalse(self.client.get(self.list_url).data['results'][0]['is_available'])
+
+
+class BookYearFilterTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True, is_superuser=True)
+        self.books = {year: Book.objects.create(title=f'Book{year}', year_of_publication=year)
+                      for year in (1869, 1990, 1995, 2000, 2021)}
+        Book.objects.create(title='BookUnknown')
+
+    def test_year_range(self):
+        """Тест фильтра по диапазону годов издания"""
+        response = self.client.get(reverse('library:books-list'),
+                                   {'year_min': 1990, 'year_max': 2000, 'ordering': '-year_of_publication'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['year_of_publication'] for book in response.data['results']], [2000, 1995, 1990])
+
+    def test_year_invalid(self):
+        """Тест фильтра по году с невалидным значением"""
+        response = self.client.get(reverse('library:books-list'), {'year_min': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_year_bucket(self):
+        """Тест фильтра по диапазонам годов в административной панели"""
+        self.client.force_login(self.staff_user)
+        response = self.client.get(reverse('admin:library_book_changelist'), {'year_bucket': '1950_1999'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({book.pk for book in response.context['cl'].queryset},
+                         {self.books[1990].pk, self.books[1995].pk})
+
+
+class BulkCirculationTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.usual_user = User.objects.create(email='user@user.com')
+        self.books = [Book.objects.create(title=f'Book{number}') for number in range(5)]
+
+    def test_bulk_checkout(self):
+        """Тест массовой выдачи книг с отметкой недоступных"""
+        self.books[0].available_copies = 0
+        self.books[0].save(update_fields=['available_copies'])
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-bulk-checkout')
+        data = {'reader': self.usual_user.pk, 'books': [book.pk for book in self.books]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = [item['status'] for item in response.data['results']]
+        self.assertEqual(statuses, ['unavailable'] + ['checked_out'] * 4)
+        self.assertEqual(Rental.objects.filter(reader=self.usual_user).count(), 4)
+        self.assertFalse(Book.objects.filter(is_available=True).exists())
+        self.assertFalse(Rental.objects.filter(deadline__isnull=True).exists())
+
+    def test_bulk_checkout_constant_queries(self):
+        """Тест числа запросов массовой выдачи: не зависит от количества книг"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-bulk-checkout')
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, {'reader': self.usual_user.pk, 'books': [self.books[0].pk]}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(url, {'reader': self.usual_user.pk, 'books': [book.pk for book in self.books[1:]]},
+                             format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_checkout_unknown_book(self):
+        """Тест массовой выдачи с несуществующей книгой: ничего не выдается"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-bulk-checkout')
+        data = {'reader': self.usual_user.pk, 'books': [self.books[0].pk, 999999]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Rental.objects.count(), 0)
+
+    def test_bulk_checkout_usual_user(self):
+        """Тест массовой выдачи обычным пользователем"""
+        self.client.force_authenticate(user=self.usual_user)
+        url = reverse('library:rent-bulk-checkout')
+        data = {'reader': self.usual_user.pk, 'books': [self.books[0].pk]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_return(self):
+        """Тест массового возврата книг с отметкой уже закрытых аренд"""
+        rentals = [Rental.objects.create(book=book, reader=self.usual_user) for book in self.books[:3]]
+        Book.objects.filter(pk__in=[book.pk for book in self.books[:3]]).update(available_copies=0)
+        Rental.objects.filter(pk=rentals[0].pk).update(is_returned=True)
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-bulk-return')
+        response = self.client.post(url, {'rentals': [rental.pk for rental in rentals]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = [item['status'] for item in response.data['results']]
+        self.assertEqual(statuses, ['already_returned', 'returned', 'returned'])
+        self.assertEqual(Rental.objects.filter(is_returned=True, return_date__isnull=False).count(), 2)
+        self.assertTrue(Book.objects.get(pk=self.books[1].pk).is_available)
+        self.assertFalse(Book.objects.get(pk=self.books[0].pk).is_available)
+
+
+class BookCopiesTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.readers = [User.objects.create(email=f'reader{number}@user.com') for number in range(4)]
+        self.book = Book.objects.create(title='Book1', total_copies=3, available_copies=3)
+
+    def checkout(self, reader, **data):
+        self.client.force_authenticate(user=self.staff_user)
+        return self.client.post(reverse('library:rent-list'), {'book': self.book.pk, 'reader': reader.pk, **data})
+
+    def test_checkout_copies(self):
+        """Тест выдачи экземпляров: книга недоступна, когда выданы все"""
+        responses = [self.checkout(reader) for reader in self.readers]
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_201_CREATED] * 3 +
+                         [status.HTTP_400_BAD_REQUEST])
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual(book.available_copies, 0)
+        self.assertFalse(book.is_available)
+
+    def test_return_copy(self):
+        """Тест возврата экземпляра: счетчик увеличивается"""
+        rental_pk = self.checkout(self.readers[0]).data['pk']
+        self.client.patch(reverse('library:rent-detail', kwargs={'pk': rental_pk}), {'is_returned': True})
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 3)
+
+    def test_full_save_keeps_counter(self):
+        """Тест: сохранение загруженной ранее книги не затирает счетчик"""
+        stale = Book.objects.get(pk=self.book.pk)
+        self.checkout(self.readers[0])
+        stale.title = 'Book2'
+        stale.save()
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual((book.title, book.available_copies), ('Book2', 2))
+
+    def test_change_total_copies(self):
+        """Тест изменения числа экземпляров через API"""
+        self.checkout(self.readers[0])
+        self.checkout(self.readers[1])
+        url = reverse('library:books-detail', kwargs={'pk': self.book.pk})
+        response = self.client.patch(url, {'total_copies': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url, {'total_copies': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['total_copies'], response.data['available_copies']), (2, 0))
+
+    def test_new_copies_go_to_holds(self):
+        """Тест поступления экземпляров: сначала они выдаются по броням"""
+        for reader in self.readers[:3]:
+            self.checkout(reader)
+        self.client.force_authenticate(user=self.readers[3])
+        self.client.post(reverse('library:holds-list'), {'book': self.book.pk})
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.patch(reverse('library:books-detail', kwargs={'pk': self.book.pk}), {'total_copies': 5})
+        self.assertEqual((response.data['total_copies'], response.data['available_copies']), (5, 1))
+        self.assertIsNotNone(Hold.objects.get().rental)
+
+    def test_checkout_copy_by_barcode(self):
+        """Тест выдачи конкретного экземпляра: один экземпляр нельзя выдать дважды"""
+        copy = BookCopy.objects.create(book=self.book, barcode='0001')
+        self.assertEqual(self.checkout(self.readers[0], copy=copy.pk).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.checkout(self.readers[1], copy=copy.pk).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 2)
+
+    def test_checkout_copy_of_other_book(self):
+        """Тест выдачи экземпляра другой книги"""
+        copy = BookCopy.objects.create(book=Book.objects.create(title='Book2'), barcode='0001')
+        self.assertEqual(self.checkout(self.readers[0], copy=copy.pk).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogImportTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.usual_user = User.objects.create(email='user@user.com')
+        self.author = Author.objects.create(name='Лев Толстой', country='Россия')
+        self.url = reverse('library:books-import')
+
+    def test_import_csv(self):
+        """Тест импорта CSV с переиспользованием существующего автора"""
+        self.client.force_authenticate(user=self.staff_user)
+        content = (
+            'title,authors,genre,year_of_publication,description\n'
+            'Война и мир,Лев Толстой,Роман,1869,"Эпопея\nв четырех томах"\n'
+            'Анна Каренина,Лев Толстой;Новый Автор,Роман,1877,\n'
+            ',Без названия,,,\n'
+        )
+        upload = SimpleUploadedFile('catalog.csv', content.encode('utf-8'))
+        response = self.client.post(self.url, {'file': upload, 'batch_size': 1}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['books'], 2)
+        self.assertEqual(response.data['skipped'], 1)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 1)
+        book = Book.objects.get(title='Анна Каренина')
+        self.assertEqual(set(book.authors.values_list('name', flat=True)), {'Лев Толстой', 'Новый Автор'})
+        self.assertEqual(Book.objects.get(title='Война и мир').description, 'Эпопея\nв четырех томах')
+        search = self.client.get(reverse('library:books-list'), {'q': 'Толстой'})
+        self.assertEqual(search.data['count'], 2)
+
+    def test_import_copies(self):
+        """Тест импорта числа экземпляров: явный 0 не заменяется значением по умолчанию"""
+        self.client.force_authenticate(user=self.staff_user)
+        content = 'title,copies\nBook0,0\nBook1,\nBook3,3\n'
+        upload = SimpleUploadedFile('catalog.csv', content.encode('utf-8'))
+        self.client.post(self.url, {'file': upload}, format='multipart')
+        records = [{'title': 'Book4', 'copies': 0}]
+        upload = SimpleUploadedFile('catalog.ndjson', '\n'.join(json.dumps(record) for record in records).encode())
+        self.client.post(self.url, {'file': upload}, format='multipart')
+        copies = {book.title: (book.total_copies, book.available_copies, book.is_available)
+                  for book in Book.objects.all()}
+        self.assertEqual(copies, {'Book0': (0, 0, False), 'Book1': (1, 1, True), 'Book3': (3, 3, True),
+                                  'Book4': (0, 0, False)})
+
+    def test_import_usual_user(self):
+        """Тест импорта у обычного пользователя"""
+        self.client.force_authenticate(user=self.usual_user)
+        upload = SimpleUploadedFile('catalog.csv', b'title\nBook1\n')
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Book.objects.count(), 0)
+
+    def test_import_catalog_command(self):
+        """Тест команды import_catalog для NDJSON с отчетом о прогрессе"""
+        records = [{'title': f'Book{i}', 'authors': ['Author1', 'Author2'], 'genre': 'Genre1'} for i in range(5)]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8') as file:
+            file.write('\n'.join(json.dumps(record) for record in records) + '\n{broken\n')
+            file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_catalog', file.name, '--batch-size', '2', stdout=out, stderr=err)
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertEqual(Book.authors.through.objects.count(), 10)
+        self.assertEqual(out.getvalue().count('Обработано записей'), 3)
+        self.assertIn('Строка 6', err.getvalue())
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.book = Book.objects.create(title='Book1')
+        self.genre = Genre.objects.create(title='Genre1')
+        self.list_url = reverse('library:books-list')
+
+    def test_etag_not_modified(self):
+        """Тест ответа 304 на совпадающий If-None-Match без запросов к базе"""
+        response = self.client.get(self.list_url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_update(self):
+        """Тест смены ETag после изменения книги"""
+        etag = self.client.get(self.list_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Book2'
+            self.book.save()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        """Тест ответа 304 на If-Modified-Since для карточки жанра"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:genres-detail', kwargs={'pk': self.genre.pk})
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class BookSearchTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.author = Author.objects.create(name='Лев Толстой', country='Россия')
+        self.genre = Genre.objects.create(title='Роман')
+        self.book = Book.objects.create(title='Война и мир', genre=self.genre,
+                                        description='Эпопея о войне 1812 года')
+        self.book.authors.add(self.author)
+        self.other_book = Book.objects.create(title='Мир приключений', description='Сборник рассказов о войне')
+        self.url = reverse('library:books-list')
+
+    def test_search_by_title(self):
+        """Тест поиска книги по названию"""
+        response = self.client.get(self.url, {'q': 'война'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['pk'] for book in response.data['results']], [self.book.pk, self.other_book.pk])
+
+    def test_search_by_author_and_genre(self):
+        """Тест поиска книги по автору и жанру"""
+        response = self.client.get(self.url, {'q': 'Толстой роман'})
+        self.assertEqual([book['pk'] for book in response.data['results']], [self.book.pk])
+
+    def test_search_vector_updated_on_author_rename(self):
+        """Тест обновления поискового вектора при переименовании автора"""
+        self.author.name = 'Федор Достоевский'
+        self.author.save()
+        response = self.client.get(self.url, {'q': 'Достоевский'})
+        self.assertEqual([book['pk'] for book in response.data['results']], [self.book.pk])
+
+    def test_search_vector_updated_on_author_removal(self):
+        """Тест обновления поискового вектора при удалении автора из книги"""
+        self.book.authors.remove(self.author)
+        response = self.client.get(self.url, {'q': 'Толстой'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_search_empty_query(self):
+        """Тест пустого поискового запроса"""
+        response = self.client.get(self.url, {'q': ''})
+        self.assertEqual(response.data['count'], 2)
+
+
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.genre = Genre.objects.create(title='Genre1')
+        self.books = [
+            Book.objects.create(title=title, genre=genre)
+            for title, genre in [('A', self.genre), ('A', None), ('B', self.genre), ('A', self.genre), ('C', None)]
+        ]
+
+    def walk(self, url, params):
+        """Проходит все страницы по ссылкам next и возвращает pk записей в порядке выдачи"""
+        pks = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            pks += [item['pk'] for item in response.data['results']]
+            if response.data['next'] is None:
+                return pks
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_books_model_ordering(self):
+        """Тест курсорной пагинации книг по сортировке модели с pk в качестве тай-брейкера"""
+        pks = self.walk(reverse('library:books-list'), {'cursor': '', 'page_size': 2})
+        expected = list(Book.objects.order_by('title', 'genre_id', 'pk').values_list('pk', flat=True))
+        self.assertEqual(pks, expected)
+
+    def test_cursor_books_custom_ordering(self):
+        """Тест курсорной пагинации книг с параметром ordering"""
+        pks = self.walk(reverse('library:books-list'), {'cursor': '', 'page_size': 2, 'ordering': '-title'})
+        expected = list(Book.objects.order_by('-title', 'pk').values_list('pk', flat=True))
+        self.assertEqual(pks, expected)
+
+    def test_cursor_rentals(self):
+        """Тест курсорной пагинации истории выдач"""
+        self.client.force_authenticate(user=self.staff_user)
+        rentals = [Rental.objects.create(book=book, reader=self.staff_user) for book in self.books]
+        Rental.objects.filter(pk__in=[rentals[1].pk, rentals[2].pk]).update(rental_date=rentals[0].rental_date)
+        pks = self.walk(reverse('library:rent-list'), {'cursor': '', 'page_size': 2})
+        expected = list(Rental.objects.order_by('-rental_date', 'pk').values_list('pk', flat=True))
+        self.assertEqual(pks, expected)
+
+    def test_invalid_cursor(self):
+        """Тест невалидного курсора"""
+        response = self.client.get(reverse('library:books-list'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_invalid_values(self):
+        """Тест курсора, значения которого не соответствуют типам полей сортировки"""
+        self.client.force_authenticate(user=self.staff_user)
+        for position in (['x', 1], [None, 'x']):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+            response = self.client.get(reverse('library:rent-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HoldTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.holder = User.objects.create(email='holder@user.com')
+        self.readers = [User.objects.create(email=f'reader{number}@user.com') for number in range(2)]
+        self.book = Book.objects.create(title='Book1', available_copies=0)
+        self.rental = Rental.objects.create(book=self.book, reader=self.holder)
+
+    def hold(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.post(reverse('library:holds-list'), {'book': self.book.pk})
+
+    def test_hold_queue_position(self):
+        """Тест очереди броней: место в очереди по порядку оформления"""
+        positions = [self.hold(reader).data['position'] for reader in self.readers]
+        self.assertEqual(positions, [1, 2])
+        response = self.client.get(reverse('library:holds-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['position'] for item in response.data['results']], [2])
+
+    def test_holds_fields(self):
+        """Тест выборки только запрошенных полей броней в ответе и в SQL"""
+        self.hold(self.readers[0])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('library:holds-list'), {'fields': 'pk,book,position'})
+        self.assertEqual(response.data['results'], [{'pk': Hold.objects.get().pk, 'book': self.book.pk, 'position': 1}])
+        self.assertFalse(any('"library_hold"."created_at"' in query['sql'] for query in context.captured_queries))
+        response = self.client.get(reverse('library:holds-list'), {'omit': 'created_at,fulfilled_at,rental'})
+        self.assertEqual(set(response.data['results'][0]), {'pk', 'reader', 'book', 'position'})
+
+    def test_hold_available_book(self):
+        """Тест брони доступной книги"""
+        book = Book.objects.create(title='Book2')
+        self.client.force_authenticate(user=self.readers[0])
+        response = self.client.post(reverse('library:holds-list'), {'book': book.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Hold.objects.exists())
+
+    def test_hold_twice(self):
+        """Тест повторной брони той же книги"""
+        self.hold(self.readers[0])
+        response = self.hold(self.readers[0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Hold.objects.count(), 1)
+
+    def test_hold_own_rental(self):
+        """Тест брони книги, которая уже у читателя"""
+        response = self.hold(self.holder)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_hold_for_other_reader(self):
+        """Тест брони книги обычным пользователем для другого читателя"""
+        self.client.force_authenticate(user=self.readers[0])
+        response = self.client.post(reverse('library:holds-list'), {'book': self.book.pk, 'reader': self.readers[1].pk})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_return_allocates_next_hold(self):
+        """Тест возврата книги: книга выдается первому в очереди, остальные продвигаются"""
+        for reader in self.readers:
+            self.hold(reader)
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-detail', kwargs={'pk': self.rental.pk})
+        response = self.client.patch(url, {'is_returned': True})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        first, second = Hold.objects.with_position().order_by('pk')
+        self.assertIsNotNone(first.fulfilled_at)
+        self.assertEqual(first.rental.reader, self.readers[0])
+        self.assertFalse(first.rental.is_returned)
+        self.assertIsNotNone(first.rental.deadline)
+        self.assertEqual(second.position, 1)
+        self.assertFalse(Book.objects.get(pk=self.book.pk).is_available)
+
+    def test_return_without_holds(self):
+        """Тест возврата книги без очереди: книга возвращается в фонд"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-detail', kwargs={'pk': self.rental.pk})
+        self.client.patch(url, {'is_returned': True})
+        self.assertTrue(Book.objects.get(pk=self.book.pk).is_available)
+
+    def test_update_without_return(self):
+        """Тест изменения аренды без возврата: книга остается у читателя"""
+        self.hold(self.readers[0])
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('library:rent-detail', kwargs={'pk': self.rental.pk})
+        self.client.patch(url, {'deadline': '2030-01-01T00:00:00Z'})
+        self.assertIsNone(Hold.objects.get().fulfilled_at)
+        self.assertFalse(Book.objects.get(pk=self.book.pk).is_available)
+
+    def test_bulk_return_allocates_next_hold(self):
+        """Тест массового возврата: книга выдается первому в очереди"""
+        self.hold(self.readers[0])
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.post(reverse('library:rent-bulk-return'), {'rentals': [self.rental.pk]}, format='json')
+        self.assertEqual(Rental.objects.get(is_returned=False).reader, self.readers[0])
+        self.assertFalse(Book.objects.get(pk=self.book.pk).is_available)
+
+
+class OverdueNotificationTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.readers = [User.objects.create(email=f'reader{number}@user.com') for number in range(3)]
+        overdue = now() - timedelta(days=1)
+        for number, reader in enumerate(self.readers):
+            for book_number in range(number + 1):
+                book = Book.objects.create(title=f'Book{number}-{book_number}')
+                Rental.objects.create(book=book, reader=reader, deadline=overdue)
+        Rental.objects.create(book=Book.objects.create(title='Returned'), reader=self.readers[0], deadline=overdue,
+                              is_returned=True)
+        Rental.objects.create(book=Book.objects.create(title='Not due'), reader=self.readers[0],
+                              deadline=now() + timedelta(days=1))
+
+    def remind(self, moment=None):
+        """Выполняет задачи рассылки по всем диапазонам читателей так же, как chord координатора."""
+        moment = moment or now()
+        ranges = reader_ranges(moment, settings.NOTIFICATION_READERS_PER_TASK)
+        return summarize_reminders([send_overdue_reminders(first, last, moment.isoformat()) for first, last in ranges])
+
+    def test_one_email_per_reader(self):
+        """Тест рассылки: одно письмо на читателя со всеми просроченными книгами"""
+        self.assertEqual(self.remind(), {'chunks': 1, 'sent': 3, 'failed': 0})
+        self.assertEqual(sorted(message.to for message in mail.outbox),
+                         [[reader.email] for reader in self.readers])
+        message = next(message for message in mail.outbox if message.to == [self.readers[2].email])
+        self.assertEqual(sum(f'Book2-{number}' in message.body for number in range(3)), 3)
+        first = next(message for message in mail.outbox if message.to == [self.readers[0].email])
+        self.assertNotIn('Returned', first.body)
+        self.assertNotIn('Not due', first.body)
+
+    def test_coordinator_fan_out(self):
+        """Тест координатора: читатели делятся на диапазоны, сводка собирается по всем задачам"""
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+        backend = patch.object(type(celery_app.conf), 'result_backend', new_callable=PropertyMock,
+                               return_value='cache+memory://')
+        backend.start()
+        self.addCleanup(backend.stop)
+        with self.settings(NOTIFICATION_READERS_PER_TASK=2), \
+                patch.object(summarize_reminders, 'run', wraps=summarize_reminders.run) as summary:
+            self.assertEqual(checking_deadline(), {'chunks': 2})
+        self.assertEqual(len(mail.outbox), 3)
+        results = summary.call_args.args[0]
+        self.assertEqual([result['sent'] for result in results], [2, 1])
+
+    def test_coordinator_without_result_backend(self):
+        """Тест координатора без бэкенда результатов: диапазоны отправляются группой без сводки"""
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+        backend = patch.object(type(celery_app.conf), 'result_backend', new_callable=PropertyMock,
+                               return_value=None)
+        backend.start()
+        self.addCleanup(backend.stop)
+        with self.settings(NOTIFICATION_READERS_PER_TASK=2), \
+                patch.object(summarize_reminders, 'run', wraps=summarize_reminders.run) as summary:
+            self.assertEqual(checking_deadline(), {'chunks': 2})
+        self.assertEqual(len(mail.outbox), 3)
+        summary.assert_not_called()
+
+    def test_reader_ranges(self):
+        """Тест разбиения читателей на диапазоны pk без пустых диапазонов"""
+        pks = [reader.pk for reader in self.readers]
+        self.assertEqual(reader_ranges(now(), 2), [(pks[0], pks[1]), (pks[2], pks[2])])
+        self.assertEqual(reader_ranges(now() - timedelta(days=2), 2), [])
+
+    def test_constant_queries(self):
+        """Тест рассылки: число запросов не зависит от числа выдач"""
+        with CaptureQueriesContext(connection) as small:
+            self.remind()
+        for number in range(10):
+            Rental.objects.create(book=Book.objects.create(title=f'Extra{number}'), reader=self.readers[0],
+                                  deadline=now() - timedelta(days=1))
+        Rental.objects.filter(is_returned=False).update(next_reminder_at=F('deadline'))
+        with CaptureQueriesContext(connection) as large:
+            self.remind()
+        self.assertEqual(len(small), len(large))
+
+    def test_reminder_not_repeated(self):
+        """Тест повторного запуска: напоминание не отправляется раньше заданного интервала"""
+        self.remind()
+        self.assertEqual(self.remind(), {'chunks': 0, 'sent': 0, 'failed': 0})
+        self.assertEqual(self.remind(now() + timedelta(days=1, minutes=1))['sent'], 3)
+
+    def test_reminder_once(self):
+        """Тест однократного напоминания при нулевом интервале"""
+        with self.settings(OVERDUE_REMINDER_INTERVAL=timedelta(0)):
+            self.remind()
+        self.assertFalse(Rental.objects.filter(is_returned=False, next_reminder_at__isnull=False,
+                                               deadline__lte=now()).exists())
+
+    def test_failed_send_released(self):
+        """Тест ошибки отправки: напоминания остаются в очереди"""
+        with patch('library.notifications.get_connection', side_effect=ConnectionError):
+            self.assertEqual(self.remind(), {'chunks': 1, 'sent': 0, 'failed': 3})
+        self.assertEqual(self.remind(), {'chunks': 1, 'sent': 3, 'failed': 0})
+
+    def test_deadline_extension_resets_reminders(self):
+        """Тест продления срока: напоминание придет после нового срока"""
+        self.remind()
+        rental = Rental.objects.filter(reader=self.readers[0], deadline__lte=now(), is_returned=False).get()
+        self.client.force_authenticate(user=User.objects.create(email='library@library.com', is_staff=True))
+        deadline = now() + timedelta(days=7)
+        self.client.patch(reverse('library:rent-detail', kwargs={'pk': rental.pk}), {'deadline': deadline.isoformat()})
+        rental.refresh_from_db()
+        self.assertEqual(rental.next_reminder_at, deadline)
+
+    def test_batches_reuse_connection(self):
+        """Тест рассылки пачками: одно соединение с почтовым сервером на пачку"""
+        with self.settings(NOTIFICATION_BATCH_SIZE=2), \
+                patch('library.notifications.get_connection', wraps=get_connection) as connection:
+            self.remind()
+        self.assertEqual(connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+
+@override_settings(DUE_SOON_REMINDER_DAYS=3, DUE_SOON_SEND_WINDOW=(0, 24))
+class DueSoonDigestTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.readers = [User.objects.create(email=f'reader{number}@user.com') for number in range(2)]
+        for number, days in enumerate((2, 1)):
+            Rental.objects.create(book=Book.objects.create(title=f'Soon{number}'), reader=self.readers[0],
+                                  deadline=now() + timedelta(days=days))
+        Rental.objects.create(book=Book.objects.create(title='Later'), reader=self.readers[0],
+                              deadline=now() + timedelta(days=10))
+        Rental.objects.create(book=Book.objects.create(title='Overdue'), reader=self.readers[0],
+                              deadline=now() - timedelta(days=1))
+        Rental.objects.create(book=Book.objects.create(title='Returned'), reader=self.readers[1],
+                              deadline=now() + timedelta(days=1), is_returned=True)
+        Rental.objects.create(book=Book.objects.create(title='Soon2'), reader=self.readers[1],
+                              deadline=now() + timedelta(days=1))
+
+    def test_one_digest_per_reader(self):
+        """Тест сводки: одно письмо на читателя со всеми книгами, срок которых скоро истекает"""
+        self.assertEqual(send_due_soon_digests(), {'sent': 2, 'failed': 0})
+        first = next(message for message in mail.outbox if message.to == [self.readers[0].email])
+        # Книги в сводке упорядочены по сроку возврата
+        self.assertLess(first.body.index('Soon1'), first.body.index('Soon0'))
+        for title in ('Later', 'Overdue'):
+            self.assertNotIn(title, first.body)
+        second = next(message for message in mail.outbox if message.to == [self.readers[1].email])
+        self.assertNotIn('Returned', second.body)
+
+    def test_single_grouped_query(self):
+        """Тест сводки: строки по читателям собираются одним запросом"""
+        with self.assertNumQueries(1):
+            digests = list(due_soon_digests(now()))
+        self.assertEqual([len(digest['rentals']) for digest in digests], [2, 1])
+
+    def test_digest_not_repeated(self):
+        """Тест повторного запуска: о выдаче напоминают один раз"""
+        send_due_soon_digests()
+        self.assertEqual(send_due_soon_digests(), {'sent': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_send_window(self):
+        """Тест окна отправки: вне заданных часов сводки не отправляются"""
+        with self.settings(DUE_SOON_SEND_WINDOW=(0, 0)):
+            self.assertEqual(send_due_soon_digests(), {'skipped': True})
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_send_retried(self):
+        """Тест ошибки отправки: выдачи остаются в очереди до следующего запуска"""
+        with patch('library.notifications.get_connection', side_effect=ConnectionError):
+            self.assertEqual(send_due_soon_digests(), {'sent': 0, 'failed': 2})
+        self.assertEqual(send_due_soon_digests(), {'sent': 2, 'failed': 0})
+
+    def test_deadline_extension_resets_digest(self):
+        """Тест продления срока: о новом сроке напомнят снова"""
+        send_due_soon_digests()
+        rental = Rental.objects.get(book__title='Soon2')
+        self.client.force_authenticate(user=User.objects.create(email='library@library.com', is_staff=True))
+        deadline = now() + timedelta(days=2)
+        self.client.patch(reverse('library:rent-detail', kwargs={'pk': rental.pk}), {'deadline': deadline.isoformat()})
+        self.assertEqual(send_due_soon_digests(), {'sent': 1, 'failed': 0})
+
+
+class QueryBudgetTestCase(APITestCase):
+    """Бюджет SQL-запросов на страницу списка: не зависит от количества записей на странице."""
+    BUDGETS = {
+        'library:books-list': 3,
+        'library:rent-list': 3,
+    }
+
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.reader = User.objects.create(email='user@user.com')
+        authors = [Author.objects.create(name=f'Author{i}') for i in range(3)]
+        genre = Genre.objects.create(title='Genre1')
+        for i in range(100):
+            book = Book.objects.create(title=f'Book{i}', genre=genre)
+            book.authors.set(authors[:2])
+            Rental.objects.create(book=book, reader=self.reader)
+
+    def assertQueryBudget(self, name, params):
+        """Проверяет, что запрос страницы из 100 записей укладывается в бюджет"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(name), {'page_size': 100, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertLessEqual(len(context.captured_queries), self.BUDGETS[name],
+                             '\n'.join(query['sql'] for query in context.captured_queries))
+        return response
+
+    def test_books_list_budget(self):
+        """Тест бюджета запросов списка книг"""
+        self.assertQueryBudget('library:books-list', {})
+
+    def test_books_list_expand_budget(self):
+        """Тест бюджета запросов списка книг с развернутыми авторами и жанром"""
+        response = self.assertQueryBudget('library:books-list', {'expand': 'authors,genre'})
+        book = response.data['results'][0]
+        self.assertEqual(book['genre']['title'], 'Genre1')
+        self.assertEqual([author['name'] for author in book['authors']], ['Author0', 'Author1'])
+
+    def test_rentals_list_expand_budget(self):
+        """Тест бюджета запросов списка выдач с развернутыми книгой и читателем"""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.assertQueryBudget('library:rent-list', {'expand': 'book,reader'})
+        rental = response.data['results'][0]
+        self.assertEqual(rental['reader']['email'], self.reader.email)
+        self.assertNotIn('password', rental['reader'])
+        self.assertEqual(len(rental['book']['authors']), 2)
+
+    def test_rentals_list_usual_user(self):
+        """Тест списка выдач у обычного пользователя: только собственные выдачи"""
+        self.client.force_authenticate(user=self.staff_user)
+        Rental.objects.create(book=Book.objects.first(), reader=self.staff_user)
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(reverse('library:rent-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 100)
+
+
+@override_settings(THROTTLE_RATES={'rent.create': {'user': '2/m', 'ip': '3/m'}, 'login': {'ip': '1/h'}})
+class ThrottlingTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.readers = [User.objects.create(email=f'reader{number}@user.com') for number in range(2)]
+        self.books = [Book.objects.create(title=f'Book{number}', total_copies=10, available_copies=10)
+                      for number in range(2)]
+
+    def rent(self, reader):
+        self.client.force_authenticate(user=reader)
+        return self.client.post(reverse('library:rent-list'), {'book': self.books[0].pk, 'reader': reader.pk})
+
+    def test_user_limit(self):
+        """Тест лимита на пользователя: лишний запрос получает 429 с Retry-After"""
+        response = self.rent(self.readers[0])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['X-RateLimit-Limit'], '2')
+        self.assertEqual(response['X-RateLimit-Remaining'], '1')
+        self.rent(self.readers[0])
+        response = self.rent(self.readers[0])
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        self.assertTrue(0 < int(response['Retry-After']) <= 30)
+        self.assertEqual(Rental.objects.count(), 2)
+
+    def test_ip_limit(self):
+        """Тест лимита на IP-адрес: общий для всех пользователей с одного адреса"""
+        self.rent(self.readers[0])
+        self.rent(self.readers[0])
+        self.assertEqual(self.rent(self.readers[1]).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.rent(self.readers[1]).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_other_actions_not_limited(self):
+        """Тест действий без настроенного лимита: заголовков лимита нет"""
+        self.client.force_authenticate(user=self.readers[0])
+        for _ in range(3):
+            response = self.client.get(reverse('library:rent-list'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-RateLimit-Limit', response)
+
+    def test_spoofed_forwarded_for(self):
+        """Тест лимита на IP-адрес: подмена X-Forwarded-For не дает нового ведра"""
+        data = {'email': 'reader0@user.com', 'password': 'wrong'}
+        self.client.post(reverse('library:token_obtain_pair'), data, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        response = self.client.post(reverse('library:token_obtain_pair'), data, HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://localhost:6379'}})
+    def test_redis_uses_lua_script(self):
+        """Тест бэкенда Redis: ведро обновляется атомарным Lua-скриптом, а не через get/set"""
+        with patch('common.throttling.TOKEN_BUCKET', return_value=[1, b'1.5']) as script:
+            self.assertEqual(take_token('bucket', 2, 1 / 30), (True, 1.5))
+        self.assertEqual(script.call_args.kwargs['args'], [2, 1 / 30])
+        self.assertIn('bucket', script.call_args.kwargs['keys'][0])
+
+    def test_login_limit(self):
+        """Тест лимита попыток входа по IP-адресу"""
+        data = {'email': 'reader0@user.com', 'password': 'wrong'}
+        self.assertEqual(self.client.post(reverse('library:token_obtain_pair'), data).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.post(reverse('library:token_obtain_pair'), data).status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.author = Author.objects.create(name='Author1', biography='Очень длинная биография')
+        self.genre = Genre.objects.create(title='Genre1')
+        self.book = Book.objects.create(title='Book1', genre=self.genre, description='Описание')
+        self.book.authors.add(self.author)
+
+    def test_authors_fields(self):
+        """Тест выборки только запрошенных полей авторов в ответе и в SQL"""
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('library:authors-list'), {'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [{'id': self.author.pk, 'name': 'Author1'}])
+        self.assertFalse(any('biography' in query['sql'] for query in context.captured_queries))
+
+    def test_rentals_fields_with_status(self):
+        """Тест выборки полей выдач вместе с вычисляемым статусом: SELECT сужается до запрошенных колонок"""
+        Rental.objects.create(book=self.book, reader=self.staff_user)
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('library:rent-list'), {'fields': 'pk,book,status'})
+        self.assertEqual(response.data['results'][0], {'pk': Rental.objects.get().pk, 'book': self.book.pk,
+                                                       'status': 'active'})
+        select = next(query['sql'] for query in context.captured_queries if 'CASE' in query['sql'])
+        self.assertNotIn('"return_date"', select)
+        self.assertNotIn('"copy_id"', select)
+
+    def test_books_omit(self):
+        """Тест исключения полей книги через omit"""
+        response = self.client.get(reverse('library:books-detail', kwargs={'pk': self.book.pk}),
+                                   {'omit': 'authors,updated_at,year_of_publication,total_copies,available_copies'})
+        self.assertEqual(response.data, {'pk': self.book.pk, 'title': 'Book1', 'genre': self.genre.pk,
+                                         'is_available': True})
+
+    def test_books_fields_with_expand(self):
+        """Тест сочетания fields и expand без лишних колонок книги"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('library:books-list'),
+                                       {'fields': 'title,genre', 'expand': 'genre,authors'})
+        book = response.data['results'][0]
+        self.assertEqual(set(book), {'title', 'genre'})
+        self.assertEqual(book['genre']['title'], 'Genre1')
+        self.assertFalse(any('"library_book"."description"' in query['sql'] for query in context.captured_queries))
+
+
 class RentalTestCase(APITestCase):
     def setUp(self):
         """Подготовка данных перед тестом"""
@@ -366,3 +1505,157 @@ class RentalTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Rental.objects.get(pk=rental.pk).is_returned, True)
         self.assertIsNotNone(Rental.objects.get(pk=rental.pk).return_date)
+
+    def test_retrieve_rent_book_without_deadline(self):
+        """Тест получения аренды без срока возврата"""
+        self.client.force_authenticate(user=self.staff_user)
+        rental = Rental.objects.create(book=self.book, reader=self.usual_user)
+        response = self.client.get(reverse('library:rent-detail', kwargs={'pk': rental.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'active')
+        self.assertEqual(response.data['status_display'], 'В аренде')
+
+    def test_rental_status(self):
+        """Тест статуса аренды в списке и фильтра по статусу"""
+        self.client.force_authenticate(user=self.staff_user)
+        book2 = Book.objects.create(title='Book2')
+        book3 = Book.objects.create(title='Book3')
+        overdue = Rental.objects.create(book=self.book, reader=self.usual_user, deadline=now() - timedelta(days=1))
+        active = Rental.objects.create(book=book2, reader=self.usual_user, deadline=now() + timedelta(days=1))
+        closed = Rental.objects.create(book=book3, reader=self.usual_user, deadline=now() - timedelta(days=1),
+                                       is_returned=True)
+        url = reverse('library:rent-list')
+        response = self.client.get(url)
+        statuses = {item['pk']: item['status'] for item in response.data['results']}
+        self.assertEqual(statuses, {overdue.pk: 'overdue', active.pk: 'active', closed.pk: 'closed'})
+        labels = {item['pk']: item['status_display'] for item in response.data['results']}
+        self.assertEqual(labels, {overdue.pk: 'Срок просрочен', active.pk: 'В аренде', closed.pk: 'Аренда закрыта'})
+        for value, rental in (('overdue', overdue), ('active', active), ('closed', closed)):
+            response = self.client.get(url, {'status': value})
+            self.assertEqual([item['pk'] for item in response.data['results']], [rental.pk])
+        response = self.client.get(url, {'status': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_return_rent_book_status(self):
+        """Тест статуса аренды в ответе на возврат книги"""
+        self.client.force_authenticate(user=self.staff_user)
+        rental = Rental.objects.create(book=self.book, reader=self.usual_user, deadline=now() - timedelta(days=1))
+        url = reverse('library:rent-detail', kwargs={'pk': rental.pk})
+        response = self.client.patch(url, {'is_returned': True})
+        self.assertEqual(response.data['status'], 'closed')
+        self.assertEqual(response.data['status_display'], 'Аренда закрыта')
+
+    def test_reopen_returned_rental(self):
+        """Тест повторного открытия закрытой аренды"""
+        self.client.force_authenticate(user=self.staff_user)
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        rental = Rental.objects.create(book=self.book, reader=self.usual_user)
+        url = reverse('library:rent-detail', kwargs={'pk': rental.pk})
+        self.client.patch(url, {'is_returned': True})
+        response = self.client.patch(url, {'is_returned': False})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Rental.objects.get(pk=rental.pk).is_returned)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 1)
+
+    def test_update_rental_book_and_reader(self):
+        """Тест изменения книги и читателя существующей аренды"""
+        self.client.force_authenticate(user=self.staff_user)
+        book2 = Book.objects.create(title='Book2')
+        rental = Rental.objects.create(book=self.book, reader=self.usual_user)
+        url = reverse('library:rent-detail', kwargs={'pk': rental.pk})
+        response = self.client.patch(url, {'book': book2.pk, 'reader': self.staff_user.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rental.refresh_from_db()
+        self.assertEqual((rental.book_id, rental.reader_id), (self.book.pk, self.usual_user.pk))
+
+
+class RentalConcurrencyTestCase(APITransactionTestCase):
+    """Параллельные выдачи идут в отдельных потоках и соединениях, поэтому нужны настоящие коммиты."""
+    threads = 16
+
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.readers = [User.objects.create(email=f'reader{number}@user.com') for number in range(self.threads)]
+        self.book = Book.objects.create(title='Book1')
+
+    def checkout(self, reader, barrier, results):
+        client = APIClient()
+        client.force_authenticate(user=self.staff_user)
+        try:
+            barrier.wait()
+            response = client.post(reverse('library:rent-list'), {'book': self.book.pk, 'reader': reader.pk})
+            results.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_concurrent_checkout_single_winner(self):
+        """Тест одновременной выдачи одной книги многим читателям: выдается ровно одна аренда"""
+        barrier = threading.Barrier(self.threads)
+        results = []
+        workers = [threading.Thread(target=self.checkout, args=(reader, barrier, results))
+                   for reader in self.readers]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(results.count(status.HTTP_201_CREATED), 1)
+        self.assertEqual(results.count(status.HTTP_400_BAD_REQUEST), self.threads - 1)
+        self.assertEqual(Rental.objects.filter(book=self.book).count(), 1)
+        self.assertFalse(Book.objects.get(pk=self.book.pk).is_available)
+
+    def test_concurrent_checkout_copies(self):
+        """Тест одновременной выдачи книги с несколькими экземплярами: выдается не больше, чем есть"""
+        Book.objects.filter(pk=self.book.pk).update(total_copies=5, available_copies=5)
+        barrier = threading.Barrier(self.threads)
+        results = []
+        workers = [threading.Thread(target=self.checkout, args=(reader, barrier, results))
+                   for reader in self.readers]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(results.count(status.HTTP_201_CREATED), 5)
+        self.assertEqual(Rental.objects.filter(book=self.book).count(), 5)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 0)
+
+    def test_concurrent_return_releases_once(self):
+        """Тест одновременного возврата одной аренды: экземпляр передается по брони один раз"""
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        rental = Rental.objects.create(book=self.book, reader=self.readers[0])
+        for reader in self.readers[1:3]:
+            Hold.objects.create(book=self.book, reader=reader)
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def return_rental():
+            client = APIClient()
+            client.force_authenticate(user=self.staff_user)
+            try:
+                barrier.wait()
+                response = client.patch(reverse('library:rent-detail', kwargs={'pk': rental.pk}), {'is_returned': True})
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=return_rental) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(results, [status.HTTP_200_OK] * self.threads)
+        self.assertEqual(Hold.objects.filter(fulfilled_at__isnull=False).count(), 1)
+        self.assertEqual(Rental.objects.filter(book=self.book, is_returned=False).count(), 1)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 0)
+
+    def test_checkout_invalidates_availability_cache(self):
+        """Тест сброса кэша списка книг с фильтром по доступности после выдачи"""
+        url = reverse('library:books-list')
+        self.assertEqual(self.client.get(url, {'is_available': True}).data['count'], 1)
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(reverse('library:rent-list'), {'book': self.book.pk, 'reader': self.readers[0].pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get(url, {'is_available': True}).data['count'], 0)
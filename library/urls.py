@@ -1,12 +1,11 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from library.views import BookViewSet, AuthorViewSet, GenreViewSet, RentalViewSet
+from library.views import BookViewSet, AuthorViewSet, GenreViewSet, HoldViewSet, RentalViewSet
 from users.apps import UsersConfig
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView
+
+from users.views import LoginView
 
 app_name = UsersConfig.name
 
@@ -16,10 +15,11 @@ router.register(r"books", BookViewSet, basename="books")
 router.register(r"authors", AuthorViewSet, basename="authors")
 router.register(r"genres", GenreViewSet, basename="genres")
 router.register(r"rent", RentalViewSet, basename="rent")
+router.register(r"holds", HoldViewSet, basename="holds")
 
 
 urlpatterns = [
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('login/', LoginView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
 
@@ -1,42 +1,183 @@
 from django.utils.timezone import now
-from datetime import timedelta, datetime
+from functools import partial
 
-from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 
-from library.models import Book, Author, Genre, Rental
-from library.paginators import Paginator
-from library.serializers import BookSerializer, AuthorSerializer, GenreSerializer, RentalSerializer
-from users.models import User
+from common.paginators import Paginator, UnionPaginator
+from common.sparse_fields import SparseQuerysetMixin
+from common.throttling import RateLimitHeadersMixin
+from library import cache
+from library.archive import rental_history
+from library.circulation import RENTAL_PERIOD, checkout_books, release_books, return_rentals
+from library.exporters import CONTENT_TYPES, StreamRenderer, stream_export
+from library.filters import BookFilter, FullTextSearchFilter, RentalFilter
+from library.importers import DEFAULT_BATCH_SIZE, CatalogImporter, detect_format
+from library.models import Book, Author, Genre, Hold, Rental
+from library.search import autocomplete, book_facets
+from library.serializers import (BookSerializer, AuthorSerializer, GenreSerializer, RentalSerializer,
+                                 BulkCheckoutSerializer, BulkReturnSerializer, HoldSerializer, RentalHistorySerializer)
+from library.signals import AVAILABILITY_FIELDS
 from users.permissions import IsLibrarian
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class AutocompleteMixin:
+    """Добавляет во вьюсет эндпоинт autocomplete с нечетким поиском по полю autocomplete_field."""
+
+    autocomplete_field = None
+    autocomplete_limit = 10
+    autocomplete_max_limit = 50
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request, *args, **kwargs):
+        """Возвращает записи, наиболее похожие на строку ?q=, не более ?limit= штук."""
+        text = request.query_params.get('q', '').strip()
+        try:
+            limit = int(request.query_params.get('limit', self.autocomplete_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число.'})
+        if not text or limit < 1:
+            return Response([])
+        limit = min(limit, self.autocomplete_max_limit)
+        return Response(list(autocomplete(self.get_queryset(), self.autocomplete_field, text, limit)))
+
+
+class CachedResponseMixin:
+    """Кэширует ответы list и retrieve и отвечает 304 на условные GET-запросы."""
+
+    cache_namespace = None
+
+    def get_cache_namespaces(self):
+        """Возвращает пространства имен кэша, от которых зависит ответ."""
+        return [self.cache_namespace]
+
+    def list(self, request, *args, **kwargs):
+        return cache.cached_response(request, self.get_cache_namespaces(),
+                                     partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cache.cached_response(request, self.get_cache_namespaces(),
+                                     partial(super().retrieve, request, *args, **kwargs))
+
+
+class ExportMixin:
+    """Добавляет во вьюсет эндпоинт export с потоковой выгрузкой таблицы export_name."""
+
+    export_name = None
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser | IsLibrarian],
+            renderer_classes=[StreamRenderer])
+    def export(self, request, *args, **kwargs):
+        """Выгружает всю таблицу в ?export_format=ndjson|csv, при ?compress=gzip сжимает на лету."""
+        file_format = request.query_params.get('export_format', 'ndjson')
+        if file_format not in CONTENT_TYPES:
+            raise ValidationError({'export_format': 'Поддерживаются форматы ndjson и csv.'})
+        compress = request.query_params.get('compress') == 'gzip'
+
+        file_name = f'{self.export_name}.{file_format}'
+        response = StreamingHttpResponse(
+            stream_export(self.export_name, file_format, compress=compress),
+            content_type='application/gzip' if compress else CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{file_name}.gz"' if compress else (
+            f'attachment; filename="{file_name}"')
+        return response
+
+
+class BookViewSet(CachedResponseMixin, ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с моделью Book."""
 
     serializer_class = BookSerializer
-    queryset = Book.objects.all()
+    queryset = Book.objects.defer('search_vector').prefetch_related('authors')
     pagination_class = Paginator
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ('title', 'genre', 'description',)
-    ordering_fields = ('title', 'genre', 'is_available',)
-    filterset_fields = ('title', 'genre', 'is_available',)
+    filter_backends = [DjangoFilterBackend, SearchFilter, FullTextSearchFilter, OrderingFilter]
+    search_fields = ('title', 'genre__title', 'description',)
+    ordering_fields = ('title', 'genre', 'is_available', 'available_copies', 'year_of_publication',)
+    filterset_class = BookFilter
+    export_name = 'books'
 
     def get_permissions(self):
         """Возвращает список разрешений в зависимости от типа пользователя."""
         if self.action in ['create', 'update', 'destroy', 'partial_update']:
             self.permission_classes = (IsAdminUser | IsLibrarian,)
-        elif self.action in ['retrieve', 'list',]:
+        elif self.action in ['retrieve', 'list', 'facets']:
             self.permission_classes = (AllowAny,)
         return super().get_permissions()
 
-class AuthorViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        """Подгружает жанр одним JOIN, если он разворачивается через ?expand=."""
+        queryset = super().get_queryset()
+        if 'genre' in BookSerializer.get_expand(self.request):
+            queryset = queryset.select_related('genre')
+        return queryset
+
+    def get_cache_namespaces(self):
+        """Списки с учетом доступности зависят и от выдач, карточка - только от своей книги: изменения авторов
+        и жанров сбрасывают карточки связанных книг по одной."""
+        if self.action == 'retrieve':
+            # /books/01/ и /books/1/ - одна книга, и версия ее карточки должна быть одна
+            try:
+                pk = int(self.kwargs[self.lookup_field])
+            except ValueError:
+                raise NotFound()
+            return [cache.book_detail(pk)]
+        namespaces = [cache.BOOK_LIST]
+        params = self.request.query_params
+        ordering = params.get('ordering', '')
+        if ('is_available' in params or any(name in ordering for name in AVAILABILITY_FIELDS)
+                or AVAILABILITY_FIELDS & set(self.get_serializer().fields)):
+            namespaces.append(cache.BOOK_AVAILABILITY)
+        return namespaces
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request, *args, **kwargs):
+        """Возвращает количество книг по жанрам, доступности и годам для тех же фильтров, что и список."""
+        namespaces = [cache.BOOK_LIST, cache.BOOK_AVAILABILITY]
+        return cache.cached_response(
+            request, namespaces,
+            lambda: Response(book_facets(self.filter_queryset(self.get_queryset()))),
+            timeout=settings.FACETS_CACHE_TIMEOUT,
+        )
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def import_catalog(self, request, *args, **kwargs):
+        """Импортирует книги из загруженного файла CSV или NDJSON пачками по batch_size записей."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Загрузите файл каталога.'})
+        file_format = request.data.get('file_format') or detect_format(upload.name)
+        if file_format not in ('csv', 'ndjson'):
+            raise ValidationError({'file_format': 'Поддерживаются форматы csv и ndjson.'})
+        try:
+            batch_size = int(request.data.get('batch_size', DEFAULT_BATCH_SIZE))
+        except ValueError:
+            batch_size = 0
+        if batch_size < 1:
+            raise ValidationError({'batch_size': 'Ожидается положительное целое число.'})
+
+        lines = (line.decode('utf-8-sig') for line in upload)
+        try:
+            report = CatalogImporter(batch_size=batch_size).run(lines, file_format)
+        except UnicodeDecodeError:
+            raise ValidationError({'file': 'Файл должен быть в кодировке UTF-8.'})
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
+class AuthorViewSet(AutocompleteMixin, CachedResponseMixin, ExportMixin, SparseQuerysetMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для работы с моделью Author."""
 
     serializer_class = AuthorSerializer
@@ -47,23 +188,42 @@ class AuthorViewSet(viewsets.ModelViewSet):
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['name', 'country']
     ordering_fields = ['name', 'country']
+    autocomplete_field = 'name'
+    cache_namespace = cache.AUTHORS
+    export_name = 'authors'
 
 
-class GenreViewSet(viewsets.ModelViewSet):
+class GenreViewSet(AutocompleteMixin, CachedResponseMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с моделью Genre."""
 
     serializer_class = GenreSerializer
     queryset = Genre.objects.all()
     pagination_class = Paginator
     permission_classes = [IsAdminUser | IsLibrarian]
+    autocomplete_field = 'title'
+    cache_namespace = cache.GENRES
 
 
-class RentalViewSet(viewsets.ModelViewSet):
+class RentalViewSet(RateLimitHeadersMixin, ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """Вьюсет для получения списка арендованных книг."""
-    queryset = Rental.objects.all()
+    # Статус аннотируется в самом queryset вьюсета, чтобы ?fields= видел его как аннотацию, а не как метод
+    queryset = Rental.objects.with_status()
     serializer_class = RentalSerializer
     pagination_class = Paginator
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = RentalFilter
+    export_name = 'rentals'
+    throttle_scope = 'rent'
 
+    def get_queryset(self):
+        """Подгружает книгу и читателя одним запросом, если они разворачиваются через ?expand=."""
+        queryset = super().get_queryset()
+        expand = RentalSerializer.get_expand(self.request)
+        if 'book' in expand:
+            queryset = queryset.select_related('book').defer('book__search_vector').prefetch_related('book__authors')
+        if 'reader' in expand:
+            queryset = queryset.select_related('reader')
+        return queryset
 
     def get_permissions(self):
         """Возвращает список разрешений в зависимости от типа пользователя."""
@@ -75,59 +235,138 @@ class RentalViewSet(viewsets.ModelViewSet):
 
 
     def perform_create(self, serializer):
-        """Делает проверку выдачи книги."""
-        book = get_object_or_404(Book, pk=serializer.validated_data['book'].pk)
-        reader = get_object_or_404(User, pk=serializer.validated_data['reader'].pk)
+        """Выдает экземпляр книги: условный UPDATE счетчика и создание аренды в одной транзакции.
 
-        if not book.is_available:
-            raise ValidationError('Книга уже выдана.')
-        else:
-            if reader:
-                book.is_available = False
-                book.save()
-                serializer.save(rental_date=now(), deadline=now() + timedelta(days=30), reader=reader, book=book)
+        Экземпляр забирает только тот запрос, чей UPDATE изменил строку, поэтому параллельные выдачи
+        не уводят счетчик в минус, а выдачи разных книг не блокируют друг друга."""
+        book = serializer.validated_data['book']
+        try:
+            with transaction.atomic():
+                if not Book.objects.filter(pk=book.pk, available_copies__gt=0).update(
+                        available_copies=F('available_copies') - 1):
+                    raise ValidationError('Книга уже выдана.')
+                serializer.save(deadline=now() + RENTAL_PERIOD)
+        except IntegrityError:
+            # Экземпляр со штрихкодом уже числится в открытой аренде
+            raise ValidationError('Экземпляр уже выдан.')
+        # update() не отправляет post_save, поэтому кэш доступности сбрасываем явно
+        cache.invalidate_books([book.pk], availability_only=True)
 
+    @action(detail=False, methods=['post'], url_path='bulk-checkout', url_name='bulk-checkout',
+            permission_classes=[IsAdminUser | IsLibrarian], serializer_class=BulkCheckoutSerializer)
+    def bulk_checkout(self, request, *args, **kwargs):
+        """Выдает читателю пачку книг одной транзакцией; недоступные книги отмечаются в результате."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = checkout_books(serializer.validated_data['reader'], serializer.validated_data['books'])
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'], url_path='bulk-return', url_name='bulk-return',
+            permission_classes=[IsAdminUser | IsLibrarian], serializer_class=BulkReturnSerializer)
+    def bulk_return(self, request, *args, **kwargs):
+        """Закрывает пачку аренд одной транзакцией; уже закрытые аренды отмечаются в результате."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = return_rentals(serializer.validated_data['rentals'])
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'], pagination_class=UnionPaginator, serializer_class=RentalHistorySerializer,
+            filter_backends=[])
+    def history(self, request, *args, **kwargs):
+        """История выдач из рабочей и архивной таблиц; читатель видит только свою, библиотекарь - любую по ?reader=."""
+        if IsAdminUser().has_permission(request, self) or IsLibrarian().has_permission(request, self):
+            reader = request.query_params.get('reader') or None
+            if reader is not None and not reader.isdigit():
+                raise ValidationError({'reader': 'Ожидается pk читателя.'})
+        else:
+            reader = request.user.pk
+        page = self.paginate_queryset(rental_history(reader))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def perform_update(self, serializer):
-        """Делает проверку возвращения книги."""
-        rental = get_object_or_404(Rental, pk=serializer.instance.pk)
-        book = rental.book
-        book.is_available = True
-        book.save()
-        serializer.save(return_date=now())
+        """При закрытии аренды передает книгу следующему в очереди броней или возвращает в фонд.
+
+        Строка аренды блокируется и перечитывается в транзакции, поэтому из параллельных возвратов одной аренды
+        (PATCH или bulk_return) книгу освобождает только первый, а остальные видят аренду уже закрытой."""
+        released = []
+        with transaction.atomic():
+            serializer.instance = Rental.objects.select_for_update().get(pk=serializer.instance.pk)
+            if serializer.instance.is_returned and serializer.validated_data.get('is_returned') is False:
+                # Книга закрытой выдачи уже вернулась в фонд или ушла по брони, повторно открыть выдачу нельзя
+                raise ValidationError({'is_returned': 'Закрытую выдачу нельзя открыть повторно.'})
+            returning = serializer.validated_data.get('is_returned') and not serializer.instance.is_returned
+            if returning:
+                serializer.save(return_date=now())
+                released = release_books([serializer.instance.book_id])
+            elif 'deadline' in serializer.validated_data:
+                # Новый срок возврата заново отсчитывает напоминания
+                serializer.save(next_reminder_at=serializer.validated_data['deadline'], due_soon_notified_at=None)
+            else:
+                serializer.save()
+        if released:
+            cache.invalidate_books(released, availability_only=True)
+        # Статус в ответе должен отражать изменения, а аннотация у объекта осталась от выборки до них
+        serializer.instance.status = Rental.objects.with_status().values_list('status', flat=True).get(
+            pk=serializer.instance.pk)
 
     def perform_destroy(self, instance):
-        """Делает проверку возвращения книги при удалении."""
-        rental = get_object_or_404(Rental, pk=instance.pk)
-        book = rental.book
-        book.is_available = True
-        book.save()
-        instance.delete()
+        """При удалении открытой аренды передает книгу следующему в очереди броней или возвращает в фонд."""
+        released = []
+        with transaction.atomic():
+            # Открыта ли аренда, проверяется под блокировкой строки, а не по объекту, прочитанному до транзакции
+            was_open = Rental.objects.select_for_update().filter(pk=instance.pk, is_returned=False).exists()
+            instance.delete()
+            if was_open:
+                released = release_books([instance.book_id])
+        if released:
+            cache.invalidate_books(released, availability_only=True)
 
     def list(self, request, *args, **kwargs):
         """Обрабатывает запросы для получения списка арендованных книг."""
 
-        queryset = self.get_queryset()
-        if IsLibrarian().has_permission(self.request, self) or IsAdminUser().has_permission(self.request, self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if IsAdminUser().has_permission(self.request, self) or IsLibrarian().has_permission(self.request, self):
             queryset = queryset.all()
         elif self.request.user.is_authenticated:
-            queryset = queryset.filter(user=self.request.user)
+            queryset = queryset.filter(reader_id=self.request.user.pk)
         page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
-    def retrieve(self, request, *args, **kwargs):
-        """Обрабатывает запросы для получения информации об аренде книги."""
-
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        response = {
-            'pk': serializer.data.get('pk'),
-            'book': serializer.data.get('book'),
-            'reader': serializer.data.get('reader'),
-            'deadline': serializer.data.get('deadline'),
-            'status': 'Срок просрочен' if datetime.strptime(serializer.data.get('deadline'),
-                                                                     '%Y-%m-%dT%H:%M:%S%z') < now() else (
-                'Аренда закрыта' if instance.is_returned else 'В аренде'),
-        }
-        return Response(response)
\ No newline at end of file
+
+class HoldViewSet(SparseQuerysetMixin, mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                  mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """Вьюсет броней: очередь на выданные книги с местом читателя в ней."""
+    # Место в очереди аннотируется в самом queryset вьюсета, чтобы ?fields= видел его как аннотацию
+    queryset = Hold.objects.with_position()
+    serializer_class = HoldSerializer
+    pagination_class = Paginator
+    permission_classes = [IsAuthenticated]
+
+    def is_staff_request(self):
+        return IsAdminUser().has_permission(self.request, self) or IsLibrarian().has_permission(self.request, self)
+
+    def get_queryset(self):
+        """Читатель видит только свои брони."""
+        queryset = super().get_queryset()
+        if not self.is_staff_request():
+            queryset = queryset.filter(reader_id=self.request.user.pk)
+        return queryset
+
+    def perform_create(self, serializer):
+        """Ставит читателя в очередь на выданную книгу."""
+        if serializer.validated_data['reader'] != self.request.user and not self.is_staff_request():
+            raise PermissionDenied('Бронировать книги можно только для себя.')
+        book = serializer.validated_data['book']
+        try:
+            with transaction.atomic():
+                # Возврат блокирует строку книги так же, поэтому бронь не встанет в очередь на книгу, уходящую в фонд
+                if Book.objects.select_for_update().values_list('available_copies', flat=True).get(pk=book.pk):
+                    raise ValidationError('Книга доступна, оформите выдачу.')
+                serializer.save()
+        except IntegrityError:
+            # Параллельный повтор той же брони, прошедший проверку сериализатора
+            raise ValidationError('Книга уже забронирована.')
+        serializer.instance.position = Hold.objects.with_position().values_list('position', flat=True).get(
+            pk=serializer.instance.pk)
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from users.roles import ROLES_CLAIM
+
+# Claims, из которых собирается пользователь без обращения к БД
+USER_CLAIMS = ('email', 'is_staff', ROLES_CLAIM)
+
+
+def _revoked_key(user_id):
+    return f'users:revoked:{user_id}'
+
+
+def revoke(user_id):
+    """Отзывает выданные пользователю access-токены до истечения их срока жизни.
+
+    Запись живет не дольше ACCESS_TOKEN_LIFETIME: новые access-токены отключенному пользователю
+    не выдаются, а уже выданные к этому времени истекут."""
+    cache.set(_revoked_key(user_id), True, timeout=settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds())
+
+
+def restore(user_id):
+    """Снимает отзыв токенов, например после повторной активации учетной записи."""
+    cache.delete(_revoked_key(user_id))
+
+
+def is_revoked(user_id):
+    return bool(cache.get(_revoked_key(user_id)))
+
+
+class LibraryTokenUser(TokenUser):
+    """Пользователь, собранный из подписанных claims access-токена, без строки users.User."""
+
+    @property
+    def email(self):
+        return self.token.get('email', '')
+
+    def get_username(self):
+        return self.email
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """JWT-аутентификация, которая на чтение не загружает пользователя из БД.
+
+    Для безопасных методов пользователь собирается из claims токена (id, email, is_staff, roles),
+    а отключенные учетные записи отсекаются по списку отзыва в кэше. Изменяющие запросы и токены,
+    выданные без этих claims, по-прежнему загружают пользователя из БД."""
+
+    def authenticate(self, request):
+        self.stateless = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None and is_revoked(user_id):
+            raise AuthenticationFailed('Учетная запись отключена.', code='user_inactive')
+        if self.stateless and all(claim in validated_token for claim in USER_CLAIMS):
+            return LibraryTokenUser(validated_token)
+        return super().get_user(validated_token)
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from phonenumber_field.modelfields import PhoneNumberField
 
 NULLABLE = {'blank': True, 'null':True}
@@ -20,6 +22,12 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "пользователь"
         verbose_name_plural = "пользователи"
+        # Поиск ?search= сравнивает UPPER(поле) LIKE UPPER('%строка%'), поэтому триграммные индексы
+        # построены по тем же выражениям
+        indexes = [
+            GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=f'user_{field}_trgm_idx')
+            for field in ('email', 'first_name', 'last_name', 'phone')
+        ]
 
     def __str__(self):
         return f'{self.first_name} {self.last_name} - {self.email} ({self.phone})'
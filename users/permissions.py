@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from users.roles import LIBRARIANS, request_roles
+
 
 class IsLibrarian(permissions.BasePermission):
     """Проверка прав доступа для пользователей группы librarians."""
@@ -7,4 +9,4 @@ class IsLibrarian(permissions.BasePermission):
 
     def has_permission(self, request, view):
         """Проверяет, состоит ли пользователь в группе librarians."""
-        return request.user.groups.filter(name="librarians").exists()
+        return LIBRARIANS in request_roles(request)
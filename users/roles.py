@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+LIBRARIANS = 'librarians'
+# Имя claim в access-токене со списком групп пользователя
+ROLES_CLAIM = 'roles'
+
+
+def _cache_key(user_id):
+    return f'users:roles:{user_id}'
+
+
+def user_roles(user_id):
+    """Группы пользователя из кэша; при промахе читаются из БД одним запросом и кэшируются.
+
+    Кэш сбрасывается сигналами при изменении групп пользователя, см. invalidate_roles."""
+    key = _cache_key(user_id)
+    roles = cache.get(key)
+    if roles is None:
+        roles = sorted(Group.objects.filter(user__pk=user_id).values_list('name', flat=True))
+        cache.set(key, roles, timeout=settings.ROLES_CACHE_TIMEOUT)
+    return roles
+
+
+def invalidate_roles(user_ids):
+    """Сбрасывает закэшированные группы пользователей."""
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def request_roles(request):
+    """Группы пользователя запроса, вычисленные не больше одного раза за запрос.
+
+    Сначала берутся из claim roles access-токена, иначе из кэша user_roles. Результат запоминается
+    на объекте запроса, поэтому повторные проверки прав и объединенные через | разрешения не обращаются
+    ни к кэшу, ни к БД."""
+    roles = getattr(request, '_user_roles', None)
+    if roles is None:
+        user = request.user
+        token = getattr(request, 'auth', None)
+        if not user or not user.is_authenticated:
+            roles = frozenset()
+        elif token is not None and hasattr(token, 'get') and token.get(ROLES_CLAIM) is not None:
+            roles = frozenset(token[ROLES_CLAIM])
+        else:
+            roles = frozenset(user_roles(user.pk))
+        request._user_roles = roles
+    return roles
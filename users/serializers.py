@@ -1,9 +1,115 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import IntegerField, ModelSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 
+from common.sparse_fields import SparseFieldsMixin
 from users.models import User
+from users.roles import ROLES_CLAIM, user_roles
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ModelSerializer):
+    """Регистрация и изменение пользователя: пароль только на запись, права и группы через API не меняются."""
+
+    class Meta:
+        model = User
+        fields = (
+            'pk',
+            'email',
+            'password',
+            'first_name',
+            'last_name',
+            'phone',
+        )
+        extra_kwargs = {'password': {'write_only': True}}
+
+    def update(self, instance, validated_data):
+        password = validated_data.pop('password', None)
+        if password is not None:
+            instance.set_password(password)
+        return super().update(instance, validated_data)
+
+
+class UserShortSerializer(SparseFieldsMixin, ModelSerializer):
+    """Краткое представление пользователя без служебных полей."""
+
+    class Meta:
+        model = User
+        fields = (
+            'pk',
+            'email',
+            'first_name',
+            'last_name',
+            'phone',
+        )
+
+
+class UserDetailSerializer(SparseFieldsMixin, ModelSerializer):
+    """Карточка пользователя для библиотекаря: без пароля и прав, с числом открытых выдач."""
+    open_rentals = IntegerField(read_only=True)
+
     class Meta:
         model = User
-        fields = '__all__'
+        fields = (
+            'pk',
+            'email',
+            'first_name',
+            'last_name',
+            'phone',
+            'is_active',
+            'is_staff',
+            'date_joined',
+            'last_login',
+            'open_rentals',
+        )
+
+
+def set_user_claims(token, user):
+    """Добавляет в токен claims, по которым TokenUserAuthentication собирает пользователя без БД."""
+    token['email'] = user.email
+    token['is_staff'] = user.is_staff
+    token[ROLES_CLAIM] = user_roles(user.pk)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдает пару токенов с email, is_staff и группами пользователя в claims."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        set_user_claims(token, user)
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Перечитывает claims пользователя при обновлении access-токена, чтобы изменения групп и прав
+    доходили до клиента не позже, чем через ACCESS_TOKEN_LIFETIME, а не через срок жизни refresh-токена."""
+
+    def validate(self, attrs):
+        """Повторяет TokenRefreshSerializer.validate, но загружает пользователя из БД один раз:
+        та же строка проверяется USER_AUTHENTICATION_RULE и дает claims нового access-токена."""
+        refresh = self.token_class(attrs['refresh'])
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)})
+        except User.DoesNotExist:
+            user = None
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        # access-токен копирует claims refresh-токена, а при ротации новый refresh тоже получает свежие claims
+        set_user_claims(refresh, user)
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Приложение token_blacklist не установлено
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.authentication import restore, revoke
+from users.models import User
+from users.roles import invalidate_roles
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_changed_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кэш групп пользователей при изменении состава групп с любой стороны связи."""
+    if action == 'pre_clear' and reverse:
+        # После очистки группы ее участников уже не узнать, поэтому запоминаем их заранее
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            invalidate_roles([instance.pk])
+        elif action == 'post_clear':
+            invalidate_roles(getattr(instance, '_cleared_user_ids', []))
+        else:
+            invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_roles(sender, instance, created=False, **kwargs):
+    """Сбрасывает кэш групп участников при переименовании или удалении группы."""
+    if not created:
+        invalidate_roles(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def revoke_inactive_tokens(sender, instance, created, **kwargs):
+    """Отзывает токены отключенной учетной записи и снимает отзыв после повторной активации."""
+    if created:
+        return
+    if instance.is_active:
+        restore(instance.pk)
+    else:
+        revoke(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_tokens(sender, instance, **kwargs):
+    """Отзывает токены удаленной учетной записи."""
+    revoke(instance.pk)
@@ -1,3 +1,231 @@
-from django.test import TestCase
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest.mock import patch
 
-# Create your tests here.
+from library.models import Book, Rental
+from library.views import RentalViewSet
+from users.authentication import TokenUserAuthentication
+from users.models import User
+from users.permissions import IsLibrarian
+from users.roles import ROLES_CLAIM, user_roles
+
+
+class UserTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        self.staff_user = User.objects.create(email='library@library.com', is_staff=True)
+        self.usual_user = User.objects.create(email='user@user.com', first_name='Иван')
+
+    def test_list_users_fields(self):
+        """Тест выборки только запрошенных полей пользователей в ответе и в SQL"""
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('users:users-list'), {'fields': 'email,first_name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn({'email': 'user@user.com', 'first_name': 'Иван'}, response.data['results'])
+        self.assertFalse(any('"password"' in query['sql'] for query in context.captured_queries))
+
+    def test_register_user(self):
+        """Тест регистрации: пароль хэшируется и не возвращается, права через API не выдаются"""
+        data = {'email': 'new@user.com', 'password': 'secret', 'is_staff': True, 'is_superuser': True}
+        response = self.client.post(reverse('users:users-list'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(set(response.data), {'pk', 'email', 'first_name', 'last_name', 'phone'})
+        user = User.objects.get(email='new@user.com')
+        self.assertTrue(user.check_password('secret'))
+        self.assertFalse(user.is_staff or user.is_superuser)
+
+    def test_update_user_password(self):
+        """Тест изменения пользователя: новый пароль хэшируется и не возвращается"""
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('users:users-detail', kwargs={'pk': self.usual_user.pk})
+        response = self.client.put(url, {'email': 'user@user.com', 'password': 'changed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('password', response.data)
+        self.usual_user.refresh_from_db()
+        self.assertTrue(self.usual_user.check_password('changed'))
+
+    def test_update_other_user_forbidden(self):
+        """Тест изменения чужой учетной записи читателем"""
+        self.client.force_authenticate(user=self.usual_user)
+        url = reverse('users:users-detail', kwargs={'pk': self.staff_user.pk})
+        for method in (self.client.patch, self.client.put):
+            response = method(url, {'email': 'library@library.com', 'password': 'hacked123'})
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.staff_user.refresh_from_db()
+        self.assertFalse(self.staff_user.check_password('hacked123'))
+
+    def test_list_users_short(self):
+        """Тест списка пользователей: пагинация и краткое представление без пароля и прав"""
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('users:users-list'), {'page_size': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'], [{'pk': self.staff_user.pk, 'email': 'library@library.com',
+                                                     'first_name': None, 'last_name': None, 'phone': None}])
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertFalse(any('"password"' in query['sql'] for query in context.captured_queries))
+
+    def test_search_users(self):
+        """Тест поиска пользователей по почте, имени и телефону без учета регистра"""
+        User.objects.create(email='petrov@user.com', last_name='Петров', phone='+79161234567')
+        self.client.force_authenticate(user=self.staff_user)
+        for search, email in (('ИВАН', 'user@user.com'), ('PETROV', 'petrov@user.com'), ('петр', 'petrov@user.com'),
+                              ('9161234', 'petrov@user.com')):
+            response = self.client.get(reverse('users:users-list'), {'search': search})
+            self.assertEqual([user['email'] for user in response.data['results']], [email], search)
+
+    def test_search_uses_index(self):
+        """Тест поиска: условие поиска совпадает с выражением триграммного индекса"""
+        queryset = User.objects.filter(email__icontains='user')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        self.assertIn('user_email_trgm_idx', plan)
+
+    def test_retrieve_user_open_rentals(self):
+        """Тест карточки пользователя: число открытых выдач и отсутствие пароля"""
+        for number in range(3):
+            Rental.objects.create(book=Book.objects.create(title=f'Book{number}'), reader=self.usual_user,
+                                  is_returned=number == 2)
+        self.client.force_authenticate(user=self.staff_user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('users:users-detail', kwargs={'pk': self.usual_user.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['open_rentals'], 2)
+        self.assertNotIn('password', response.data)
+        self.assertNotIn('groups', response.data)
+
+
+class RolesTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.librarians = Group.objects.create(name='librarians')
+        self.librarian = User.objects.create(email='librarian@library.com', password='secret')
+        self.librarian.set_password('secret')
+        self.librarian.save()
+        self.librarian.groups.add(self.librarians)
+        self.usual_user = User.objects.create(email='user@user.com')
+
+    def make_request(self, user, token=None):
+        """Запрос DRF с заданными пользователем и токеном"""
+        request = APIView().initialize_request(APIRequestFactory().get('/'))
+        request.user = user
+        request._auth = token
+        return request
+
+    def test_roles_memoized_per_request(self):
+        """Тест проверки прав: группы читаются из БД не больше одного раза за запрос"""
+        request = self.make_request(self.librarian)
+        with self.assertNumQueries(1):
+            self.assertTrue(IsLibrarian().has_permission(request, None))
+            self.assertTrue(IsLibrarian().has_permission(request, None))
+        # Следующий запрос берет группы из кэша
+        with self.assertNumQueries(0):
+            self.assertTrue(IsLibrarian().has_permission(self.make_request(self.librarian), None))
+
+    def test_roles_from_token(self):
+        """Тест проверки прав по claim roles в access-токене без обращения к БД"""
+        response = self.client.post(reverse('library:token_obtain_pair'),
+                                    {'email': 'librarian@library.com', 'password': 'secret'})
+        token = AccessToken(response.data['access'])
+        self.assertEqual(token[ROLES_CLAIM], ['librarians'])
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertTrue(IsLibrarian().has_permission(self.make_request(self.librarian, token), None))
+
+    def test_refresh_rereads_roles(self):
+        """Тест обновления токена: новый access-токен содержит актуальные группы"""
+        response = self.client.post(reverse('library:token_obtain_pair'),
+                                    {'email': 'librarian@library.com', 'password': 'secret'})
+        self.librarian.groups.remove(self.librarians)
+        response = self.client.post(reverse('library:token_refresh'), {'refresh': response.data['refresh']})
+        self.assertEqual(AccessToken(response.data['access'])[ROLES_CLAIM], [])
+
+    def test_refresh_loads_user_once(self):
+        """Тест обновления токена: пользователь читается из БД одним запросом"""
+        response = self.client.post(reverse('library:token_obtain_pair'),
+                                    {'email': 'librarian@library.com', 'password': 'secret'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('library:token_refresh'), {'refresh': response.data['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum('FROM "users_user"' in query['sql'] for query in queries.captured_queries), 1)
+        self.assertEqual(AccessToken(response.data['access'])['email'], 'librarian@library.com')
+
+    def test_refresh_inactive_user(self):
+        """Тест обновления токена отключенного или удаленного пользователя"""
+        refresh = self.client.post(reverse('library:token_obtain_pair'),
+                                   {'email': 'librarian@library.com', 'password': 'secret'}).data['refresh']
+        User.objects.filter(pk=self.librarian.pk).update(is_active=False)
+        response = self.client.post(reverse('library:token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.librarian.delete()
+        response = self.client.post(reverse('library:token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_invalidated_on_groups_change(self):
+        """Тест сброса кэша групп при изменении состава группы с обеих сторон связи"""
+        self.assertEqual(user_roles(self.usual_user.pk), [])
+        self.usual_user.groups.add(self.librarians)
+        self.assertEqual(user_roles(self.usual_user.pk), ['librarians'])
+        self.librarians.user_set.remove(self.usual_user)
+        self.assertEqual(user_roles(self.usual_user.pk), [])
+        self.assertEqual(user_roles(self.librarian.pk), ['librarians'])
+        self.librarians.user_set.clear()
+        self.assertEqual(user_roles(self.librarian.pk), [])
+
+    def test_cache_invalidated_on_group_delete(self):
+        """Тест сброса кэша групп при удалении группы"""
+        self.assertEqual(user_roles(self.librarian.pk), ['librarians'])
+        self.librarians.delete()
+        self.assertEqual(user_roles(self.librarian.pk), [])
+
+
+class TokenUserAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        """Подготовка данных перед тестом"""
+        cache.clear()
+        self.reader = User.objects.create(email='user@user.com')
+        self.reader.set_password('secret')
+        self.reader.save()
+        Rental.objects.create(book=Book.objects.create(title='Book1'), reader=self.reader)
+        response = self.client.post(reverse('library:token_obtain_pair'),
+                                    {'email': 'user@user.com', 'password': 'secret'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        patcher = patch.object(RentalViewSet, 'authentication_classes', [TokenUserAuthentication])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_read_without_user_lookup(self):
+        """Тест чтения: пользователь собирается из токена без запроса к таблице пользователей"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('library:rent-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertFalse(any(f'FROM "{User._meta.db_table}"' in query['sql'] for query in context.captured_queries))
+
+    def test_write_loads_user(self):
+        """Тест изменяющего запроса: пользователь загружается из БД"""
+        book = Book.objects.create(title='Book2')
+        response = self.client.post(reverse('library:rent-list'), {'book': book.pk, 'reader': self.reader.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_deactivated_user_revoked(self):
+        """Тест отзыва токенов отключенной учетной записи"""
+        self.reader.is_active = False
+        self.reader.save()
+        response = self.client.get(reverse('library:rent-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.reader.is_active = True
+        self.reader.save()
+        response = self.client.get(reverse('library:rent-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
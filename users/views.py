@@ -1,14 +1,42 @@
+from django.db.models import Count, Q
 from rest_framework import viewsets
+from rest_framework.filters import SearchFilter
 from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework_simplejwt.views import TokenObtainPairView
 
+from common.paginators import Paginator
+from common.sparse_fields import SparseQuerysetMixin, parse_sparse_fields
+from common.throttling import RateLimitHeadersMixin
 from users.models import User
 from users.permissions import IsLibrarian
-from users.serializers import UserSerializer
+from users.serializers import UserDetailSerializer, UserSerializer, UserShortSerializer
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(RateLimitHeadersMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = UserSerializer
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('pk')
+    pagination_class = Paginator
+    filter_backends = [SearchFilter]
+    # Поиск по этим полям идет по триграммным индексам user_*_trgm_idx
+    search_fields = ['email', 'first_name', 'last_name', 'phone']
+    throttle_scope = 'users'
+
+    def get_serializer_class(self):
+        """Список отдает краткое представление, карточка - подробное без пароля и прав."""
+        if self.action == 'list':
+            return UserShortSerializer
+        if self.action == 'retrieve':
+            return UserDetailSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """Список без ?fields= читает только поля краткого представления, карточка считает открытые выдачи."""
+        queryset = super().get_queryset()
+        if self.action == 'list' and parse_sparse_fields(self.request) == (None, set()):
+            queryset = queryset.only(*(name for name in UserShortSerializer.Meta.fields if name != 'pk'))
+        elif self.action == 'retrieve':
+            queryset = queryset.annotate(open_rentals=Count('rental', filter=Q(rental__is_returned=False)))
+        return queryset
 
     def perform_create(self, serializer):
         user = serializer.save(is_active=True)
@@ -18,7 +46,11 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.action == 'create':
             self.permission_classes = (AllowAny,)
-        elif self.action in ['update', 'destroy','retrieve', 'list',]:
+        elif self.action in ['update', 'partial_update', 'destroy','retrieve', 'list',]:
             self.permission_classes = (IsAdminUser | IsLibrarian,)
         return super().get_permissions()
 
+
+class LoginView(RateLimitHeadersMixin, TokenObtainPairView):
+    """Выдача пары JWT-токенов с ограничением частоты попыток входа."""
+    throttle_scope = 'login'